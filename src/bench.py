@@ -0,0 +1,721 @@
+import os
+import re
+import cv2
+import copy
+import json
+import time
+import pickle
+import resource
+import pathlib
+import heapq
+import argparse
+import contextlib
+import subprocess
+import multiprocessing
+import numpy as np
+from collections import defaultdict
+
+import solve
+from core import util, segment, connect, pieces, sides, matrix, shards, graph, board, frontier
+from core.batch import SideBatch
+from core.index import SideIndex
+
+
+def _photos(path):
+    """
+    All the photos under a directory, including the per-sequence sub directories
+    """
+    return sorted(p for p in pathlib.Path(path).rglob('*') if re.match(r'.*\.jpe?g', p.name))
+
+
+def _piece_contours(contours):
+    """
+    Only keep the contours that step 1 would cut out as pieces
+    """
+    return [c for c in contours if min(cv2.boundingRect(c)[2:]) >= 100]
+
+
+def _contour_drift(baseline, contours, shape):
+    """
+    How far (in px) each baseline piece border point is from the nearest border found by another preset
+    Returns the mean and max distance
+    """
+    if not baseline:
+        return 0.0, 0.0
+    canvas = np.full(shape, 255, np.uint8)
+    cv2.drawContours(canvas, contours, -1, 0, 1)
+    dist = cv2.distanceTransform(canvas, cv2.DIST_L2, 3)
+    pts = np.concatenate([c.reshape(-1, 2) for c in baseline])
+    d = dist[pts[:, 1], pts[:, 0]]
+    return float(d.mean()), float(d.max())
+
+
+def bench_seg(args):
+    """
+    Times each segmentation preset per photo and measures how far its piece borders drift from the bilateral baseline
+    """
+    params = solve.SEG_NEW_PARAMS if args.new else solve.SEG_PARAMS
+    photos = _photos(args.path)[:args.limit]
+    presets = args.presets.split(',') if args.presets else list(segment.PRESETS.keys())
+    print(f"> Benchmarking {len(presets)} presets on {len(photos)} photos")
+
+    imgs = [solve._read_photo(p, params) for p in photos]
+    baseline = [_piece_contours(segment.find_contours(img, dict(params, preset=segment.DEFAULT_PRESET))) for img in imgs]
+
+    rows = []
+    for preset in presets:
+        p = dict(params, preset=preset)
+        duration = 0.0
+        pieces = 0
+        drifts = []
+        for img, base in zip(imgs, baseline):
+            start_time = time.time()
+            contours = segment.find_contours(img, p)
+            duration += time.time() - start_time
+
+            contours = _piece_contours(contours)
+            pieces += len(contours)
+            drifts.append(_contour_drift(base, contours, img.shape))
+
+        mean_drift = sum(d[0] for d in drifts) / max(1, len(drifts))
+        max_drift = max([d[1] for d in drifts] or [0.0])
+        rows.append((preset, 1000 * duration / max(1, len(imgs)), pieces, mean_drift, max_drift))
+
+    base_ms = next((r[1] for r in rows if r[0] == segment.DEFAULT_PRESET), None)
+    base_pieces = sum(len(b) for b in baseline)
+    print(f"\n{'preset':<16}{'ms/photo':>10}{'speedup':>9}{'pieces':>8}{'mean px':>9}{'max px':>9}")
+    for preset, ms, pieces, mean_drift, max_drift in rows:
+        speedup = f"{base_ms / ms:.2f}x" if base_ms and ms else '-'
+        color = util.WHITE if pieces == base_pieces else util.RED
+        print(f"{preset:<16}{ms:>10.1f}{speedup:>9}{color}{pieces:>8}{util.WHITE}{mean_drift:>9.2f}{max_drift:>9.2f}")
+    print(f"\nBaseline ({segment.DEFAULT_PRESET}) found {base_pieces} pieces")
+    return rows
+
+
+def _legacy_load_bmp_as_binary_pixels(path):
+    """
+    The per-pixel loader util.load_bmp_as_binary_pixels used to be, kept to compare against
+    """
+    from PIL import Image
+    with Image.open(path) as img:
+        width, height = img.size
+        pixels = np.array(img.getdata())
+        if type(pixels[0]) not in [np.int64, np.int32] and len(pixels[0]) >= 3:
+            pixels = np.array([sum(p[:3]) / 3 for p in pixels])
+    pixels = pixels.reshape((height, width))
+    return np.where(pixels > 0, 1, 0).astype(np.int8), width, height
+
+
+def bench_load(args):
+    """
+    Times loading each piece bitmap with the legacy and the vectorized loader, and checks they agree bit for bit
+    """
+    bmps = sorted(p for p in pathlib.Path(args.path).iterdir() if p.suffix == '.bmp')[:args.limit]
+    print(f"> Loading {len(bmps)} piece bitmaps")
+
+    legacy, vectorized, packed = 0.0, 0.0, 0.0
+    for bmp in bmps:
+        start_time = time.time()
+        old, w0, h0 = _legacy_load_bmp_as_binary_pixels(bmp)
+        legacy += time.time() - start_time
+
+        start_time = time.time()
+        new, w1, h1 = util.load_bmp_as_binary_pixels(bmp)
+        vectorized += time.time() - start_time
+
+        start_time = time.time()
+        util.load_bmp_as_binary_mask(bmp, crop_margin=1, packed=True)
+        packed += time.time() - start_time
+
+        if (w0, h0) != (w1, h1) or old.dtype != new.dtype or not np.array_equal(old, new):
+            raise Exception(f"Loaders disagree on {bmp}")
+
+    n = max(1, len(bmps))
+    print(f"legacy:            {1000 * legacy / n:.2f} ms/piece")
+    print(f"vectorized:        {1000 * vectorized / n:.2f} ms/piece ({legacy / max(vectorized, 1e-9):.1f}x)")
+    print(f"cropped + packed:  {1000 * packed / n:.2f} ms/piece")
+    print(f"{util.GREEN}All {len(bmps)} bitmaps identical{util.WHITE}")
+
+
+def _load_pieces(path, limit=None):
+    ps = pieces.Piece.load_all(path, resample=True)
+    if limit:
+        ps = dict(list(ps.items())[:limit])
+    print(f"> Loaded {len(ps)} pieces from {path}")
+    return ps
+
+
+def bench_con_ipc(args):
+    """
+    Compares shipping the pieces with every connect task (the old way) against shipping them once per worker
+    """
+    ps = _load_pieces(args.path, args.limit)
+    workers = os.cpu_count()
+    ps_bytes = len(pickle.dumps(ps))
+
+    # legacy: every task pickles the whole dataset, and sends back the whole piece
+    start_time = time.time()
+    with multiprocessing.Pool(processes=8) as pool:
+        results = [pool.apply_async(connect._score_piece, (ps, piece_id)) for piece_id in ps.keys()]
+        [r.get() for r in results]
+    legacy_time = time.time() - start_time
+    legacy_sent = sum(len(pickle.dumps((ps, piece_id))) for piece_id in list(ps.keys())[:1]) * len(ps)
+    legacy_back = sum(len(pickle.dumps((piece_id, piece))) for piece_id, piece in ps.items())
+
+    # once per worker: tasks are id ranges, and only the raw fits come back
+    start_time = time.time()
+    with connect._pool(ps) as pool:
+        fits = connect._score_all(pool, ps.keys())
+    shared_time = time.time() - start_time
+    chunks = connect._chunks(ps.keys(), 4 * workers)
+    shared_sent = workers * ps_bytes + sum(len(pickle.dumps((chunk, None))) for chunk in chunks)
+    shared_back = len(pickle.dumps(list(fits.items())))
+
+    mb = lambda n: f"{n / (1 << 20):.1f} MB"
+    print(f"\n{'':<16}{'sent':>12}{'received':>12}{'seconds':>10}")
+    print(f"{'per task':<16}{mb(legacy_sent):>12}{mb(legacy_back):>12}{legacy_time:>10.2f}")
+    print(f"{'per worker':<16}{mb(shared_sent):>12}{mb(shared_back):>12}{shared_time:>10.2f}")
+    print(f"\n{workers} workers; the per worker figure counts one full copy each, which a fork() start does not even need")
+
+
+def _same_fits(a, b):
+    """
+    True if two lists of (piece_id, fits) found the same pairs, with errors equal up to float rounding
+    """
+    a, b = dict(a), dict(b)
+    for piece_id in a.keys():
+        for fa, fb in zip(a[piece_id], b[piece_id]):
+            if [f[:2] for f in fa] != [f[:2] for f in fb]:
+                return False
+            if not np.allclose([f[2] for f in fa], [f[2] for f in fb]):
+                return False
+    return True
+
+
+def bench_con_batch(args):
+    """
+    Times scoring pieces one side pair at a time against the batched NumPy engine, and checks they agree
+    """
+    ps = _load_pieces(args.path, args.limit)
+    piece_ids = list(ps.keys())
+
+    start_time = time.time()
+    scalar = [connect._score_piece(ps, piece_id) for piece_id in piece_ids]
+    scalar_time = time.time() - start_time
+
+    start_time = time.time()
+    batch = SideBatch(ps)
+    batched, counts = batch.fits_for(piece_ids, block_size=args.block)
+    batched_time = time.time() - start_time
+
+    print(f"one pair at a time:  {scalar_time:.2f} s")
+    print(f"batched ({args.block}x{args.block}): {batched_time:.2f} s ({scalar_time / max(batched_time, 1e-9):.1f}x)")
+    print(f"scored {counts['scored']} of {counts['pairs']} side pairs, the rest were outside the length window")
+    if not _same_fits(scalar, batched):
+        raise Exception("The batched engine disagrees with error_when_fit_with")
+    print(f"{util.GREEN}Same fits{util.WHITE}")
+
+
+def _fit_pairs(fits_by_piece):
+    """
+    {(piece_id, side_id, other_piece_id, other_side_id): error} of every fit
+    """
+    return {(piece_id, si, op, os_): error for (piece_id, fits) in fits_by_piece for si, side_fits in enumerate(fits) for (op, os_, error) in side_fits}
+
+
+def _pruned_pairs(fits_by_piece):
+    """
+    The fit pairs connect._prune_fits keeps, within WORST_MULTIPLIER of each side's best
+    """
+    pruned = set()
+    for (piece_id, fits) in fits_by_piece:
+        for si, side_fits in enumerate(fits):
+            if side_fits:
+                least_error = min(error for (_, _, error) in side_fits)
+                pruned.update((piece_id, si, op, os_) for (op, os_, error) in side_fits if error <= least_error * connect.WORST_MULTIPLIER)
+    return pruned
+
+
+def bench_con_cascade(args):
+    """
+    Times the cascade matcher against scoring every pair in the length window, and reports what each stage rejects
+    """
+    ps = _load_pieces(args.path, args.limit)
+    piece_ids = list(ps.keys())
+    batch = SideBatch(ps)
+
+    start_time = time.time()
+    full, _ = batch.fits_for(piece_ids, block_size=args.block)
+    full_time = time.time() - start_time
+
+    start_time = time.time()
+    cascaded, counts = batch.fits_for(piece_ids, block_size=args.block, cascade=True)
+    cascade_time = time.time() - start_time
+
+    scored = max(counts['scored'], 1)
+    print(f"full error on every pair: {full_time:.2f} s")
+    print(f"cascade:                  {cascade_time:.2f} s ({full_time / max(cascade_time, 1e-9):.1f}x)")
+    print(f"stage 1 (descriptors) rejected {counts['stage1_rejected']} of {counts['scored']} pairs ({round(100 * counts['stage1_rejected'] / scored, 1)}%)")
+    print(f"stage 2 (coarse error) rejected {counts['stage2_rejected']} ({round(100 * counts['stage2_rejected'] / scored, 1)}%)")
+    print(f"stage 3 (full error) scored {counts['full']} ({round(100 * counts['full'] / scored, 1)}%)")
+
+    full_pairs = _fit_pairs(full)
+    cascade_pairs = _fit_pairs(cascaded)
+    lost = set(full_pairs) - set(cascade_pairs)
+    print(f"fits lost: {len(lost)} of {len(full_pairs)}")
+
+    # the fit that would survive pruning is the best one, so losing it costs more than losing a weak one
+    best = {}
+    for (piece_id, si, op, os_), error in full_pairs.items():
+        if error < best.get((piece_id, si), (None, np.inf))[1]:
+            best[(piece_id, si)] = ((piece_id, si, op, os_), error)
+    best_lost = [pair for (pair, _) in best.values() if pair in lost]
+    print(f"best fits lost: {len(best_lost)} of {len(best)}")
+
+    # the known true neighbours must all make it through
+    solution = connect.SOLUTION
+    if args.solution:
+        with open(args.solution, 'r') as f:
+            solution = json.load(f)
+    true_lost = [((p1, s1), (p2, s2)) for ((p1, s1), (p2, s2)) in solution
+                 if ((p1, s1, p2, s2) in full_pairs or (p2, s2, p1, s1) in full_pairs)
+                 and (p1, s1, p2, s2) not in cascade_pairs and (p2, s2, p1, s1) not in cascade_pairs]
+    if true_lost:
+        raise Exception(f"The cascade drops {len(true_lost)} true neighbours: {true_lost}")
+    print(f"{util.GREEN}No true neighbours dropped{util.WHITE}")
+
+
+def _grow_pieces(ps, n, noise=0.5):
+    """
+    Repeats the pieces, with new ids and a little noise on their sides, until there are n of them
+    """
+    grown = dict(list(ps.items())[:n])
+    originals = list(ps.values())
+    rng = np.random.default_rng(0)
+    next_id = max(ps.keys()) + 1
+    while len(grown) < n:
+        piece = copy.deepcopy(originals[len(grown) % len(originals)])
+        for side in piece.sides:
+            side.vertices = side.vertices + rng.normal(0, noise, side.vertices.shape)
+            side.vertices_flipped = side.vertices_flipped + rng.normal(0, noise, side.vertices_flipped.shape)
+        grown[next_id] = piece
+        next_id += 1
+    return grown
+
+
+def bench_con_ann(args):
+    """
+    Times the nearest neighbour index against the exact sweep as the puzzle grows, and reports its recall
+    """
+    ps = _load_pieces(args.path)
+    print(f"{'pieces':>8} {'exact':>9} {'index':>9} {'speed-up':>9} {'recall':>8} {'best recall':>12} {'pruned recall':>14} {'pruned sides':>13}")
+    for n in [int(n) for n in args.sizes.split(',')]:
+        grown = _grow_pieces(ps, n)
+        piece_ids = list(grown.keys())
+        batch = SideBatch(grown)
+
+        start_time = time.time()
+        exact, _ = batch.fits_for(piece_ids, cascade=connect.USE_CASCADE)
+        exact_time = time.time() - start_time
+
+        start_time = time.time()
+        approx, _ = SideIndex(batch).fits_for(piece_ids, k=args.k, worst_multiplier=None if args.lossy else connect.WORST_MULTIPLIER)
+        index_time = time.time() - start_time
+
+        exact_pairs = _fit_pairs(exact)
+        approx_pairs = _fit_pairs(approx)
+        recall = len(set(exact_pairs) & set(approx_pairs)) / max(len(exact_pairs), 1)
+
+        best = {}
+        for (piece_id, si, op, os_), error in exact_pairs.items():
+            if error < best.get((piece_id, si), (None, np.inf))[1]:
+                best[(piece_id, si)] = ((piece_id, si, op, os_), error)
+        best_recall = sum(pair in approx_pairs for (pair, _) in best.values()) / max(len(best), 1)
+
+        # what step 4 gets: the fits left after pruning, and the sides whose pruned fits come out exactly the same
+        exact_pruned, approx_pruned = _pruned_pairs(exact), _pruned_pairs(approx)
+        pruned_recall = len(exact_pruned & approx_pruned) / max(len(exact_pruned), 1)
+        exact_sides, approx_sides = defaultdict(set), defaultdict(set)
+        for sides_of, pairs in ((exact_sides, exact_pruned), (approx_sides, approx_pruned)):
+            for pair in pairs:
+                sides_of[pair[:2]].add(pair)
+        same_sides = sum(approx_sides.get(side) == fits for side, fits in exact_sides.items()) / max(len(exact_sides), 1)
+
+        print(f"{n:>8} {exact_time:>8.2f}s {index_time:>8.2f}s {exact_time / max(index_time, 1e-9):>8.1f}x {100 * recall:>7.1f}% {100 * best_recall:>11.1f}%"
+              f" {100 * pruned_recall:>13.1f}% {100 * same_sides:>12.1f}%")
+
+
+def bench_con_symmetry(args):
+    """
+    Measures how asymmetric the error is: how far apart the two directions of each fitting side pair are
+    """
+    ps = _load_pieces(args.path, args.limit)
+    piece_ids = list(ps.keys())
+    batch = SideBatch(ps)
+    both, _ = batch.fits_for(piece_ids, cascade=connect.USE_CASCADE)
+
+    # over every pair that fits at least one way
+    fit_pairs = _fit_pairs(both)
+    row_of = {(int(p), int(si)): row for row, (p, si) in enumerate(zip(batch.piece_ids, batch.side_ids))}
+    keys = list(fit_pairs.keys())
+    forward = np.array([fit_pairs[k] for k in keys])
+    backward = batch.pair_errors(np.array([row_of[(op, os_)] for (_, _, op, os_) in keys], dtype=np.int64),
+                                 np.array([row_of[(p, si)] for (p, si, _, _) in keys], dtype=np.int64))
+    one_way = backward > sides.SIDE_MAX_ERROR_TO_MATCH
+    if len(keys):
+        difference = np.abs(forward - backward)[~one_way]
+        print(f"error of a fit, one way vs the other: mean {difference.mean():.3f}, max {difference.max():.3f}")
+    print(f"side pairs that fit one way only: {int(one_way.sum())} of {len(keys)} fits")
+
+
+def bench_con_bound(args):
+    """
+    Times error_when_fit_with and SideBatch.fits_for with and without the early cutoff, and checks every pair under it comes out the same
+    """
+    ps = _load_pieces(args.path, args.limit)
+    side_list = [side for piece in ps.values() for side in piece.sides if not side.is_edge]
+    pairs = [(a, b) for a in side_list for b in side_list if a.piece_id != b.piece_id]
+
+    start_time = time.time()
+    full = [a.error_when_fit_with(b) for (a, b) in pairs]
+    full_time = time.time() - start_time
+
+    start_time = time.time()
+    bounded = [a.error_when_fit_with(b, max_error=sides.SIDE_MAX_ERROR_TO_MATCH) for (a, b) in pairs]
+    bounded_time = time.time() - start_time
+
+    cutoff = sides.SIDE_MAX_ERROR_TO_MATCH
+    abandoned = sum(1 for (e, b) in zip(full, bounded) if e != b)
+    print(f"full:    {full_time:.2f} s for {len(pairs)} side pairs")
+    print(f"bounded: {bounded_time:.2f} s ({full_time / max(bounded_time, 1e-9):.1f}x), {abandoned} pairs stopped early")
+    if any((e <= cutoff) != (b <= cutoff) or (e <= cutoff and e != b) for (e, b) in zip(full, bounded)):
+        raise Exception("The early cutoff changed an error under SIDE_MAX_ERROR_TO_MATCH")
+    if any(b > e + 1e-9 for (e, b) in zip(full, bounded)):
+        raise Exception("The early cutoff returned more than the full error")
+
+    # the same through the batch engine, as connect scores them
+    batch = SideBatch(ps)
+    times, found = {}, {}
+    for bounded in (False, True):
+        start_time = time.time()
+        found[bounded], _ = batch.fits_for(list(ps.keys()), cascade=connect.USE_CASCADE, bounded=bounded)
+        times[bounded] = time.time() - start_time
+    print(f"batch full:    {times[False]:.2f} s")
+    print(f"batch bounded: {times[True]:.2f} s ({times[False] / max(times[True], 1e-9):.1f}x)")
+    if _fit_pairs(found[False]) != _fit_pairs(found[True]):
+        raise Exception("The early cutoff changed the batch fits")
+    print(f"{util.GREEN}Same errors under the cutoff{util.WHITE}")
+
+
+def bench_con_matrix(args):
+    """
+    Times writing the side error matrix tile by tile, then rethresholding from it against scoring again
+    """
+    ps = _load_pieces(args.path, args.limit)
+    piece_ids = list(ps.keys())
+    matrix_sides = connect._matrix_sides(ps)
+    path = os.path.join(args.out, matrix.MATRIX_FILENAME)
+
+    start_time = time.time()
+    connect._init_worker(ps)
+    errors = matrix.ErrorMatrix.create(path, [p for (p, _) in matrix_sides], [si for (_, si) in matrix_sides], 'bench', tile=args.tile)
+    for (ti, tj) in errors.missing():
+        connect._score_tile((path, ti, tj))
+    write_time = time.time() - start_time
+    print(f"wrote {len(errors)} x {len(errors)} sides in {errors.n_tiles ** 2} tiles: {write_time:.2f} s, {os.path.getsize(path) / 1e6:.1f} MB")
+
+    for max_error in [float(e) for e in args.thresholds.split(',')]:
+        start_time = time.time()
+        scored, _ = connect._worker_batch.fits_for(piece_ids, max_error=max_error)
+        score_time = time.time() - start_time
+
+        start_time = time.time()
+        fits = matrix.ErrorMatrix(path).fits(max_error)
+        read_time = time.time() - start_time
+
+        # float16 rounding can move pairs right at the threshold
+        scored_pairs = set(_fit_pairs(scored))
+        read_pairs = set(_fit_pairs(fits.items()))
+        print(f"max error {max_error}: scoring {score_time:.2f} s, from the matrix {read_time:.2f} s ({score_time / max(read_time, 1e-9):.1f}x), "
+              f"{len(scored_pairs ^ read_pairs)} of {len(scored_pairs)} fits differ by float16 rounding")
+
+
+def bench_con_shards(args):
+    """
+    Stands in for several machines with one process each computing a range of shards into a shared directory,
+    then merges them and checks the result against building the connectivity in one go
+    """
+    vecDir = pathlib.Path(args.path).joinpath(solve.VecDir)
+    total = len(shards.shards(shards.load(vecDir)))
+    per_node = -(-total // args.nodes)
+    ranges = [f"{k}-{min(k + per_node, total) - 1}" for k in range(0, total, per_node)]
+    run = pathlib.Path(__file__).parent.joinpath('run.py')
+
+    for attempt in ('first run', 'resumed'):
+        start_time = time.time()
+        nodes = [subprocess.Popen(['python', str(run), '--path', args.path, '--shards', r, '--shard-dir', args.out, '--processes', '1'],
+                                  stdout=subprocess.DEVNULL) for r in ranges]
+        if any(node.wait() != 0 for node in nodes):
+            raise Exception("A shard process failed")
+        print(f"{attempt}: {total} shards on {len(ranges)} processes in {time.time() - start_time:.2f} s")
+
+    merged_dir = pathlib.Path(args.out).joinpath('merged')
+    single_dir = pathlib.Path(args.out).joinpath('single')
+    os.makedirs(merged_dir, exist_ok=True)
+    os.makedirs(single_dir, exist_ok=True)
+    merged = shards.merge(vecDir, args.out, merged_dir)
+    single = connect.build(vecDir, single_dir)
+
+    differ = [p for p in single.keys() if [[f[:2] for f in side] for side in single[p]] != [[f[:2] for f in side] for side in merged[p]]]
+    if differ:
+        raise Exception(f"The merged shards disagree with a single build on {len(differ)} pieces, e.g. {differ[:5]}")
+    print(f"{util.GREEN}Merged shards match a single build{util.WHITE}")
+
+
+def _rss_kb():
+    with open('/proc/self/status', 'r') as f:
+        return int(re.search(r'VmRSS:\s+(\d+)', f.read()).group(1))
+
+
+def _measure_load(args):
+    """
+    Loads the graph one way in a fresh worker, and walks every fit like the board solver would
+    """
+    directory, binary = args
+    before = _rss_kb()
+    start_time = time.time()
+    if binary:
+        conn = graph.Graph(os.path.join(directory, graph.GRAPH_FILENAME))
+    else:
+        conn = _load_json(directory)
+    load_time = time.time() - start_time
+    walked = sum(len(fits) for piece_id in conn for fits in conn[piece_id])
+    return load_time, time.time() - start_time, _rss_kb() - before, walked
+
+
+def _load_json(directory):
+    """
+    connectivity.json into lists of tuples, the way board.build and builder.load_conn used to
+    """
+    with open(os.path.join(directory, graph.JSON_FILENAME), 'r') as f:
+        raw = json.load(f)
+    ps = {}
+    for piece_id, fits in raw.items():
+        ps[int(piece_id)] = [[tuple(f) for f in fits[i]] for i in range(4)]
+    return ps
+
+
+def bench_graph_load(args):
+    """
+    Load time and RSS of connectivity.json against the memory-mapped binary graph
+    """
+    if not os.path.exists(os.path.join(args.path, graph.GRAPH_FILENAME)):
+        graph.Graph.from_json(os.path.join(args.path, graph.JSON_FILENAME), os.path.join(args.path, graph.GRAPH_FILENAME))
+    for name, binary in (('connectivity.json', False), ('connectivity.graph', True)):
+        # a fresh process each, so one doesn't warm up the other's heap
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            load_time, walk_time, rss, walked = pool.apply(_measure_load, ((args.path, binary),))
+        print(f"{name:<20} load {1000 * load_time:8.1f} ms, load + walk {1000 * walk_time:8.1f} ms, RSS +{rss / 1024:.1f} MB ({walked} fits)")
+
+
+def _solve_quietly(connectivity):
+    """
+    Runs the board solver without its progress output, returns (solved, seconds, stats)
+    """
+    stats = {}
+    start_time = time.time()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            board.build(connectivity=connectivity, stats=stats)
+            solved = True
+        except Exception:
+            solved = False
+    return solved, time.time() - start_time, stats
+
+
+def _load_graph(path):
+    conn = graph.load(path)
+    return conn.to_dict() if isinstance(conn, graph.Graph) else conn
+
+
+def bench_board_mutual(args):
+    """
+    Fan-out and board solver cost with and without the mutual-consistency pass
+    """
+    conn = _load_graph(args.path)
+    for mode in (None, 'reciprocal', 'rank'):
+        variant = connect.mutual_fits(conn, mode) if mode else conn
+        counts = sorted(connect.fan_out(variant))
+        # the graph keeps the scored errors, the solver applies the penalty
+        board.ONE_WAY_PENALTY = connect.MUTUAL_PENALTY if mode == 'rank' else None
+        solved, seconds, stats = _solve_quietly(variant)
+        board.ONE_WAY_PENALTY = None
+        print(f"{mode or 'as built':<11} fan-out mean {sum(counts) / len(counts):5.2f}, max {counts[-1]:3}, "
+              f"{stats.get('iterations', 0):>9} nodes expanded, {seconds:7.2f} s, {'solved' if solved else 'not solved'}")
+
+
+def _measure_solve(args):
+    """
+    Solves in a fresh worker with some board module settings, for its peak RSS
+    """
+    path, settings = args
+    for setting, value in settings.items():
+        setattr(board, setting, value)
+    conn = _load_graph(path)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    solved, seconds, stats = _solve_quietly(conn)
+    return solved, seconds, stats, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+
+
+def bench_board_state(args):
+    """
+    Peak RSS and nodes per second of a Board.copy per frontier entry against one shared board with placement chains
+    """
+    for name, shared in (('Board.copy', False), ('shared board', True)):
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            solved, seconds, stats, rss = pool.apply(_measure_solve, ((args.path, {'SHARED_BOARD': shared}),))
+        nodes = stats.get('iterations', 0)
+        print(f"{name:<13} {nodes:>9} nodes in {seconds:7.2f} s ({nodes / max(seconds, 1e-9):9.0f}/s), "
+              f"peak frontier {stats.get('frontier', 0)}, peak RSS +{rss / 1024:.1f} MB, {'solved' if solved else 'not solved'}")
+
+
+def bench_board_search(args):
+    """
+    Time to solution and peak frontier of each board search order, on the same graph
+    """
+    for search in args.searches.split(','):
+        settings = {'SEARCH': search, 'BEAM_WIDTH': args.beam_width, 'HEURISTIC_WEIGHT': args.weight}
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            solved, seconds, stats, rss = pool.apply(_measure_solve, ((args.path, settings),))
+        print(f"{search:<7} {stats.get('iterations', 0):>9} nodes in {seconds:7.2f} s, peak frontier {stats.get('frontier', 0):>8}, "
+              f"peak RSS +{rss / 1024:.1f} MB, {'solved' if solved else 'not solved'}")
+
+
+def _time_queue(kind, priorities):
+    """
+    Seconds to push every priority then pop them all, for a frontier.FRONTIERS kind or 'heapq' on bare (priority, item)
+    tuples, the way the solver used to, where equal priorities fall back to comparing the items
+    """
+    items = [[board.Placement(None, 0, 0, 0, 0)] for _ in range(len(priorities))]
+    start_time = time.time()
+    if kind == 'heapq':
+        q = []
+        for priority, item in zip(priorities, items):
+            heapq.heappush(q, (priority, item))
+        while q:
+            heapq.heappop(q)
+    else:
+        q = frontier.new(kind)
+        for priority, item in zip(priorities, items):
+            q.push(priority, item)
+        while len(q):
+            q.pop()
+    return time.time() - start_time
+
+
+def bench_board_frontier(args):
+    """
+    Push and pop throughput of the solver frontiers against heapq, over joint errors in the graph's integer units
+    """
+    rng = np.random.default_rng(0)
+    for size in [int(s) for s in args.sizes.split(',')]:
+        priorities = rng.integers(0, args.max_error, size=size).tolist()
+        timings = { kind: _time_queue(kind, priorities) for kind in ('heapq', *frontier.FRONTIERS) }
+        print(f"{size:>9} entries: " + ", ".join(f"{kind} {seconds:7.2f} s ({2 * size / seconds / 1e6:5.2f} M ops/s)" for kind, seconds in timings.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    benches = parser.add_subparsers(dest='bench', required=True)
+
+    p = benches.add_parser('seg', help='Step 1: time and drift of each segmentation preset')
+    p.add_argument('--path', default='src/data/0raw', help='Directory with the photos', type=str)
+    p.add_argument('--presets', default=None, help='Comma separated presets, defaults to all of them', type=str)
+    p.add_argument('--limit', default=None, help='Only use the first n photos', type=int)
+    p.add_argument('--new', action='store_true', help='Use the seg_new (one piece per photo) parameters')
+    p.set_defaults(func=bench_seg)
+
+    p = benches.add_parser('load', help='Step 2: per-piece bitmap load time')
+    p.add_argument('--path', default='src/data/1seg', help='Directory with the piece bitmaps', type=str)
+    p.add_argument('--limit', default=None, help='Only use the first n bitmaps', type=int)
+    p.set_defaults(func=bench_load)
+
+    p = benches.add_parser('con-ipc', help='Step 3: bytes shipped to and from the connect workers')
+    p.add_argument('--path', default='src/data/2vec', help='Directory with the side files', type=str)
+    p.add_argument('--limit', default=None, help='Only use the first n pieces', type=int)
+    p.set_defaults(func=bench_con_ipc)
+
+    p = benches.add_parser('con-batch', help='Step 3: one-pair-at-a-time vs batched side errors')
+    p.add_argument('--path', default='src/data/2vec', help='Directory with the side files', type=str)
+    p.add_argument('--limit', default=200, help='Only use the first n pieces', type=int)
+    p.add_argument('--block', default=connect.BATCH_BLOCK_SIZE, help='Block size, in sides', type=int)
+    p.set_defaults(func=bench_con_batch)
+
+    p = benches.add_parser('con-cascade', help='Step 3: cascade matcher rejection rates, speed and recall')
+    p.add_argument('--path', default='src/data/2vec', help='Directory with the side files', type=str)
+    p.add_argument('--limit', default=None, help='Only use the first n pieces', type=int)
+    p.add_argument('--block', default=connect.BATCH_BLOCK_SIZE, help='Block size, in sides', type=int)
+    p.add_argument('--solution', default=None, help='JSON list of true [[piece, side], [piece, side]] neighbours, defaults to connect.SOLUTION', type=str)
+    p.set_defaults(func=bench_con_cascade)
+
+    p = benches.add_parser('con-ann', help='Step 3: nearest neighbour side index vs the exact sweep, from 500 to 5000 pieces')
+    p.add_argument('--path', default='src/data/2vec', help='Directory with the side files', type=str)
+    p.add_argument('--sizes', default='500,1000,2000,5000', help='Comma separated piece counts, pieces are repeated with noise past the dataset size', type=str)
+    p.add_argument('--k', default=sides.INDEX_CANDIDATES, help='Candidates re-ranked per side', type=int)
+    p.add_argument('--lossy', action='store_true', help='Only ever look at the k candidates, instead of widening until the pruned fits are exact')
+    p.set_defaults(func=bench_con_ann)
+
+    p = benches.add_parser('con-symmetry', help='Step 3: how asymmetric the side pair error is')
+    p.add_argument('--path', default='src/data/2vec', help='Directory with the side files', type=str)
+    p.add_argument('--limit', default=300, help='Only use the first n pieces', type=int)
+    p.set_defaults(func=bench_con_symmetry)
+
+    p = benches.add_parser('con-bound', help='Step 3: error_when_fit_with and the batch engine with and without the early cutoff')
+    p.add_argument('--path', default='src/data/2vec', help='Directory with the side files', type=str)
+    p.add_argument('--limit', default=100, help='Only use the first n pieces', type=int)
+    p.set_defaults(func=bench_con_bound)
+
+    p = benches.add_parser('con-matrix', help='Step 3: writing the side error matrix, and rethresholding from it vs scoring again')
+    p.add_argument('--path', default='src/data/2vec', help='Directory with the side files', type=str)
+    p.add_argument('--limit', default=None, help='Only use the first n pieces', type=int)
+    p.add_argument('--out', default='/tmp', help='Directory for the matrix file', type=str)
+    p.add_argument('--tile', default=matrix.TILE_SIZE, help='Tile size, in sides', type=int)
+    p.add_argument('--thresholds', default='3.0,5.5,8.0', help='Comma separated SIDE_MAX_ERROR_TO_MATCH values to rethreshold at', type=str)
+    p.set_defaults(func=bench_con_matrix)
+
+    p = benches.add_parser('con-shards', help='Step 3: sharded connectivity on several processes, resumed, then merged')
+    p.add_argument('--path', default='src/data', help='Data directory, with the side files in "2vec"', type=str)
+    p.add_argument('--nodes', default=4, help='Processes standing in for machines', type=int)
+    p.add_argument('--out', default='/tmp/shards', help='Shared shard directory', type=str)
+    p.set_defaults(func=bench_con_shards)
+
+    p = benches.add_parser('graph-load', help='Step 4: loading connectivity.json vs the binary graph')
+    p.add_argument('--path', default='src/data/3con', help='Directory with the connectivity graph', type=str)
+    p.set_defaults(func=bench_graph_load)
+
+    p = benches.add_parser('board-mutual', help='Step 4: solver cost with and without the mutual-consistency pass')
+    p.add_argument('--path', default='src/data/3con', help='Directory with the connectivity graph', type=str)
+    p.set_defaults(func=bench_board_mutual)
+
+    p = benches.add_parser('board-state', help='Step 4: Board.copy per frontier entry vs a shared board with placement chains')
+    p.add_argument('--path', default='src/data/3con', help='Directory with the connectivity graph', type=str)
+    p.set_defaults(func=bench_board_state)
+
+    p = benches.add_parser('board-search', help='Step 4: greedy vs cumulative cost vs beam search order for the board solver')
+    p.add_argument('--path', default='src/data/3con', help='Directory with the connectivity graph', type=str)
+    p.add_argument('--searches', default='greedy,astar,mean,beam', help='Comma separated board.SEARCH values', type=str)
+    p.add_argument('--beam-width', default=board.BEAM_WIDTH, help='Boards kept per depth by the beam search', type=int)
+    p.add_argument('--weight', default=board.HEURISTIC_WEIGHT, help='Weight of the remaining cells estimate of astar', type=float)
+    p.set_defaults(func=bench_board_search)
+
+    p = benches.add_parser('board-frontier', help='Step 4: push/pop throughput of the bucket and heap frontiers vs heapq')
+    p.add_argument('--sizes', default='10000,100000,1000000,10000000', help='Comma separated frontier sizes', type=str)
+    p.add_argument('--max-error', default=5500, help='Priorities are drawn from [0, max-error), error * 1000 like the graph', type=int)
+    p.set_defaults(func=bench_board_frontier)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,7 @@ from typing import List
 import numpy as np
 import pathlib
 
-from core import sides, util
+from core import rasters, sides, util
 from core.config import *
 
 
@@ -140,14 +140,47 @@ class Candidate(object):
 class Vector(object):
     @staticmethod
     def from_file(filename, id) -> 'Vector':
-        # Open image file
-        binary_pixels, width, height = util.load_bmp_as_binary_pixels(filename)
+        if pathlib.Path(filename).suffix == '.pack':
+            # a session's raster pack: only read this one piece out of it
+            pack = rasters.RasterPack(filename)
+            binary_pixels, width, height = pack.load(id)
+            filename = pathlib.Path(filename).with_name(pack.name(id))
+        else:
+            # Open image file
+            binary_pixels, width, height = util.load_bmp_as_binary_pixels(filename)
         if width > MAX_PIECE_DIMENSIONS[0] or height > MAX_PIECE_DIMENSIONS[1]:
             raise Exception(f"!!!!!!!!!!\nPiece @ {id} {filename} is too large: {width}x{height} - are two pieces touching?")
 
         v = Vector(pixels=binary_pixels, width=width, height=height, id=id, filename=filename)
         return v
 
+    @staticmethod
+    def from_contour(contour, id, filename=None, margin=5) -> 'Vector':
+        """
+        Builds a vector straight from an ordered cv2 contour (CHAIN_APPROX_NONE), skipping the bitmap round-trip
+        The piece is placed `margin` pixels from the top-left, the same as in its segmented bitmap
+        """
+        pts = np.asarray(contour).reshape(-1, 2).astype(np.int64)
+        x, y = pts.min(axis=0)
+        w, h = pts.max(axis=0) - (x, y) + 1
+        width, height = int(w + 2 * margin), int(h + 2 * margin)
+        if width > MAX_PIECE_DIMENSIONS[0] or height > MAX_PIECE_DIMENSIONS[1]:
+            raise Exception(f"!!!!!!!!!!\nPiece @ {id} {filename} is too large: {width}x{height} - are two pieces touching?")
+
+        pts = pts - (x - margin, y - margin)
+
+        # vectorize() winds clockwise (on screen) from the top-left-most border pixel, so match that
+        xs, ys = pts[:, 0], pts[:, 1]
+        if np.sum(xs * np.roll(ys, -1) - np.roll(xs, -1) * ys) < 0:
+            pts = pts[::-1]
+        start = np.lexsort((pts[:, 0], pts[:, 1]))[0]
+        pts = np.roll(pts, -start, axis=0)
+
+        v = Vector(pixels=None, width=width, height=height, id=id, filename=filename)
+        v.vertices = [(int(px), int(py)) for (px, py) in pts]
+        v.centroid = util.centroid(v.vertices)
+        return v
+
     def __init__(self, pixels, width, height, id, filename=None) -> None:
         self.pixels = pixels
         self.width = width
@@ -157,11 +190,14 @@ class Vector(object):
         self.sides = []
         self.corners = []
         self.filename = filename
+        self.vertices = None
 
     def process(self, output_path=None, metadata={}, photo_space_position=(0, 0), scale_factor=1.0, render=False):
         print(f"> Vectorizing piece {self.id}")
-        self.find_border_raster()
-        self.vectorize()
+        if self.vertices is None:
+            # pieces built from a contour already have their border traced
+            self.find_border_raster()
+            self.vectorize()
 
         try:
             self.find_four_corners()
@@ -244,6 +280,7 @@ class Vector(object):
             metadata['vertices'] = vertices
             metadata['piece_center'] = list(side.piece_center)
             metadata['is_edge'] = side.is_edge
+            metadata['shape'] = sides.shape_class(side.vertices, side.piece_center, side.is_edge)
             # metadata['incenter'] = list(self.incenter)
             with open(side_path, 'w') as f:
                 f.write(json.dumps(metadata))
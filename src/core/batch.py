@@ -0,0 +1,215 @@
+"""
+Scores whole blocks of side pairs at once with NumPy broadcasting
+
+It computes the same thing as Side.error_when_fit_with(other_side) (flip=True), one block of
+row sides x column sides at a time, so memory stays bounded by the block size
+
+With the cascade on, each block goes through cheaper tests first, and only the pairs that
+survive them pay for the full polyline error:
+ 1. a few scalars per side: tab depth, signed area and neck width
+ 2. the error between the polylines downsampled to a handful of points
+ 3. the full error
+"""
+import numpy as np
+
+from core import sides
+
+
+# what error_when_fit_with returns for pairs that can never fit
+NO_MATCH = 1000
+
+# sides loaded without a shape class can fit anything
+UNKNOWN_SHAPE = -1
+
+
+def _polyline_errors(p1, p2, p1_len, max_error=None):
+    """
+    util.error_between_polylines over any number of polyline pairs at once
+    p1 and p2 are (..., n, 2) and broadcast against each other, p1_len broadcasts against the result
+    With max_error, only the pairs that could still get under it get the shifted pass, the others get a lower bound
+    """
+    n = p1.shape[-2]
+
+    # sample along the polylines at fixed intervals
+    d = p1 - p2
+    differences = np.abs(d)
+    error = differences.sum(axis=(-2, -1))
+    shift = (differences - d).sum(axis=-2) / n
+
+    # only allow a little bit of y shifting, up to +/- 5 pixels
+    shift[..., 1] = np.clip(shift[..., 1], -5, 5)
+
+    if max_error is None:
+        # shift by the mean error, then recompute
+        error_shifted = np.abs(d - shift[..., None, :]).sum(axis=(-2, -1))
+        return np.minimum(error, error_shifted) / p1_len
+
+    # same bound as util.shifted_error_bound
+    bound = np.maximum(np.abs(d.sum(axis=-2) - n * shift).sum(axis=-1), error - n * np.abs(shift).sum(axis=-1))
+    result = np.minimum(error, bound) / p1_len
+    hopeful = result <= max_error
+
+    error_shifted = np.abs(d[hopeful] - shift[hopeful][:, None, :]).sum(axis=(-2, -1))
+    result[hopeful] = np.minimum(error[hopeful], error_shifted) / np.broadcast_to(p1_len, result.shape)[hopeful]
+    return result
+
+
+def _descriptors(polylines):
+    """
+    Stage 1 scalars of each (n, 2) polyline, which lies along the x axis from its first point:
+    the signed depth of its furthest point, its signed mean offset (area), and the width of its neck at half depth
+    """
+    ys = polylines[:, :, 1]
+    furthest = np.argmax(np.abs(ys), axis=1)
+    depth = ys[np.arange(len(ys)), furthest]
+    area = ys.mean(axis=1)
+
+    deep = np.abs(ys) >= (np.abs(depth) / 2)[:, None]
+    xs = polylines[:, :, 0]
+    neck = np.where(deep, xs, -np.inf).max(axis=1) - np.where(deep, xs, np.inf).min(axis=1)
+    return depth, area, neck
+
+
+class SideBatch(object):
+    def __init__(self, ps) -> None:
+        """
+        Stacks the resampled sides of every piece, in piece order then side order
+        """
+        side_list = [(piece_id, si, side) for piece_id, piece in ps.items() for si, side in enumerate(piece.sides)]
+        self.piece_ids = np.array([p for (p, _, _) in side_list], dtype=np.int64)
+        self.side_ids = np.array([si for (_, si, _) in side_list], dtype=np.int64)
+        self.is_edge = np.array([bool(s.is_edge) for (_, _, s) in side_list], dtype=bool)
+        self.shape = np.array([UNKNOWN_SHAPE if s.shape is None else s.shape for (_, _, s) in side_list], dtype=np.int8)
+        self.vertices = np.array([s.vertices for (_, _, s) in side_list], dtype=np.float64)
+        self.vertices_flipped = np.array([s.vertices_flipped for (_, _, s) in side_list], dtype=np.float64)
+        self.length = np.array([s.length for (_, _, s) in side_list], dtype=np.float64)
+        self.v_length = np.array([s.v_length for (_, _, s) in side_list], dtype=np.float64)
+
+        # cascade data: scalars of each side as a row (vertices) and as a column (flipped),
+        # and both polylines downsampled for stage 2
+        self.row_descriptors = _descriptors(self.vertices)
+        self.col_descriptors = _descriptors(self.vertices_flipped)
+        coarse = np.round(np.linspace(0, self.vertices.shape[1] - 1, sides.CASCADE_COARSE_POINTS)).astype(int)
+        self.coarse_vertices = self.vertices[:, coarse]
+        self.coarse_flipped = self.vertices_flipped[:, coarse]
+
+    def __len__(self) -> int:
+        return len(self.piece_ids)
+
+    def errors(self, rows, cols, max_error=None):
+        """
+        Returns a (len(rows), len(cols)) array with the error of fitting each row side with each column side
+        With max_error, errors above it are only lower bounds
+        """
+        error = _polyline_errors(self.vertices[rows][:, None], self.vertices_flipped[cols][None], self.v_length[cols][None], max_error)
+        return self._gate(error, rows[:, None], cols[None])
+
+    def pair_errors(self, rows, cols, max_error=None):
+        """
+        Returns the error of fitting each rows[k] with cols[k]
+        With max_error, errors above it are only lower bounds
+        """
+        error = _polyline_errors(self.vertices[rows], self.vertices_flipped[cols], self.v_length[cols], max_error)
+        return self._gate(error, rows, cols)
+
+    def _gate(self, error, rows, cols):
+        # sides must be roughly the same length, and neither may be an edge
+        d_scale = 1.0 - (self.length[rows] / self.length[cols])
+        error[np.abs(d_scale) > sides.SIDE_MAX_LENGTH_DISCREPANCY] = NO_MATCH
+        error[self.is_edge[rows] | self.is_edge[cols]] = NO_MATCH
+        return error
+
+    def cascade(self, rows, cols, max_error, counts):
+        """
+        Runs a block of rows x cols through the cascade; returns the (i, j) of the pairs that survive stages 1 and 2
+        """
+        # stage 1: scalars, with tolerances relative to the row side's length
+        scale = self.length[rows][:, None]
+        keep = np.ones((len(rows), len(cols)), dtype=bool)
+        tolerances = (sides.CASCADE_DEPTH_TOLERANCE, sides.CASCADE_AREA_TOLERANCE, sides.CASCADE_NECK_TOLERANCE)
+        for row_d, col_d, tolerance in zip(self.row_descriptors, self.col_descriptors, tolerances):
+            keep &= np.abs(row_d[rows][:, None] - col_d[cols][None]) <= tolerance * scale
+        counts['stage1_rejected'] += keep.size - int(keep.sum())
+
+        # stage 2: coarse polylines, scaled up to be comparable with the full error
+        i, j = np.nonzero(keep)
+        coarse = _polyline_errors(self.coarse_vertices[rows[i]], self.coarse_flipped[cols[j]], self.v_length[cols[j]])
+        coarse *= self.vertices.shape[1] / self.coarse_vertices.shape[1]
+        survive = coarse <= sides.CASCADE_COARSE_MULTIPLIER * max_error
+        counts['stage2_rejected'] += len(survive) - int(survive.sum())
+        return i[survive], j[survive]
+
+    def fits_for(self, piece_ids, other_ids=None, max_error=sides.SIDE_MAX_ERROR_TO_MATCH, block_size=128, cascade=False, bounded=False):
+        """
+        Finds every side of the other pieces (all of them by default) within max_error of each of these pieces' sides
+        Returns [(piece_id, fits)], with each side's fits unsorted and in the same order _score_piece finds them,
+        and counts of the side pairs that were possible, that were scored, and that each cascade stage rejected
+        With bounded, pairs that can't get under max_error skip the shifted pass
+        """
+        rows = np.isin(self.piece_ids, list(piece_ids))
+        cols = np.ones(len(self), dtype=bool)
+        if other_ids is not None:
+            cols &= np.isin(self.piece_ids, list(other_ids))
+        found, counts = self.found_between(rows, cols, max_error, block_size, cascade, bounded)
+
+        fits = { piece_id: [[], [], [], []] for piece_id in piece_ids }
+        for row, hits in found.items():
+            # back in piece order, like a plain scan would find them
+            fits[int(self.piece_ids[row])][int(self.side_ids[row])] = [
+                (int(self.piece_ids[col]), int(self.side_ids[col]), error) for (col, error) in sorted(hits, key=lambda h: h[0])]
+
+        return list(fits.items()), counts
+
+    def found_between(self, rows, cols, max_error=sides.SIDE_MAX_ERROR_TO_MATCH, block_size=128, cascade=False, bounded=False):
+        """
+        Scores the sides set in the rows mask against the sides set in the cols mask, edges left out
+        Returns {row: [(col, error)]} of the fits under max_error, and the counts fits_for returns
+        """
+        rows = rows & ~self.is_edge
+        cols = cols & ~self.is_edge
+
+        found = {}
+        counts = {'pairs': int(rows.sum()) * int(cols.sum()), 'scored': 0, 'stage1_rejected': 0, 'stage2_rejected': 0, 'full': 0}
+
+        # tabs only plug into blanks, so each class of rows is only compared with the complementary columns
+        unknown = self.shape == UNKNOWN_SHAPE
+        for row_shape, col_shapes in ((sides.TAB, (sides.BLANK,)), (sides.BLANK, (sides.TAB,)), (UNKNOWN_SHAPE, (sides.TAB, sides.BLANK))):
+            r = np.flatnonzero(rows & (self.shape == row_shape))
+            c = np.flatnonzero(cols & (np.isin(self.shape, col_shapes) | unknown))
+            self._sweep(r, c, max_error, block_size, cascade, bounded, found, counts)
+        return found, counts
+
+    def _sweep(self, rows, cols, max_error, block_size, cascade, bounded, found, counts):
+        """
+        Scores rows x cols, adding each fit under max_error to found[row]
+        """
+        # sweep over the sides sorted by length: a pair can only fit if
+        # |1 - l_row / l_col| <= SIDE_MAX_LENGTH_DISCREPANCY, i.e. l_row / (1 + d) <= l_col <= l_row / (1 - d)
+        # so each block of rows only needs the slice of columns inside that window
+        rows = rows[np.argsort(self.length[rows], kind='stable')]
+        cols = cols[np.argsort(self.length[cols], kind='stable')]
+        col_lengths = self.length[cols]
+        d = sides.SIDE_MAX_LENGTH_DISCREPANCY
+        bound = max_error if bounded else None
+
+        for r0 in range(0, len(rows), block_size):
+            r = rows[r0:r0 + block_size]
+            lo = self.length[r].min() / (1 + d) * (1 - 1e-9)
+            hi = self.length[r].max() / (1 - d) * (1 + 1e-9)
+            c_start = np.searchsorted(col_lengths, lo, side='left')
+            c_end = np.searchsorted(col_lengths, hi, side='right')
+            counts['scored'] += len(r) * (c_end - c_start)
+
+            for c0 in range(c_start, c_end, block_size):
+                c = cols[c0:min(c0 + block_size, c_end)]
+                if cascade:
+                    i, j = self.cascade(r, c, max_error, counts)
+                    error = self.pair_errors(r[i], c[j], bound)
+                else:
+                    i, j = np.indices((len(r), len(c))).reshape(2, -1)
+                    error = self.errors(r, c, bound).reshape(-1)
+                counts['full'] += len(error)
+
+                error[self.piece_ids[r[i]] == self.piece_ids[c[j]]] = np.inf
+                for k in np.flatnonzero(error <= max_error):
+                    found.setdefault(r[i[k]], []).append((c[j[k]], float(error[k])))
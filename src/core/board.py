@@ -1,8 +1,9 @@
-import os
-import json
 import math
 import heapq
+import functools
+import numpy as np
 
+from core import frontier, graph
 from core.config import *
 
 """
@@ -33,6 +34,26 @@ OPPOSITE = {
 MAX_ITERATIONS_TO_FIND_BORDER = 9000
 MAX_ITERATIONS = 150000000
 
+# frontier entries hold a Placement chain and share one Board that follows them with an undo log,
+# rather than each holding its own Board.copy
+SHARED_BOARD = True
+
+# the order the frontier is searched in:
+#   'greedy': the error of the latest joint only
+#   'astar': summed error of every joint so far, plus HEURISTIC_WEIGHT x the mean best error for each empty cell
+#   'mean': mean error per joint so far
+#   'beam': breadth first, only the BEAM_WIDTH cheapest boards by summed error are kept at each depth
+SEARCH = 'greedy'
+HEURISTIC_WEIGHT = 1.0
+BEAM_WIDTH = 1000
+
+# fits the other side doesn't list back count as this many times their error in the search, None to take fits as they are
+# (like connect.MUTUAL_FITS = 'rank' ranks them, without changing the errors in the graph)
+ONE_WAY_PENALTY = None
+
+# frontier.FRONTIERS kind holding the entries: 'bucket' (a FIFO per integer priority) or 'heap'
+FRONTIER = 'bucket'
+
 class Orientation(object):
     ZERO_POINTS_UP = 0
     ZERO_POINTS_RIGHT = 1
@@ -40,40 +61,103 @@ class Orientation(object):
     ZERO_POINTS_LEFT = 3
 
 
+class Placement(object):
+    """
+    One placed piece on top of its parent's placements; a frontier entry only costs this
+    """
+    __slots__ = ('parent', 'piece_id', 'x', 'y', 'orientation', 'depth')
+
+    def __init__(self, parent, piece_id, x, y, orientation) -> None:
+        self.parent = parent
+        self.piece_id = piece_id
+        self.x = x
+        self.y = y
+        self.orientation = orientation
+        self.depth = 1 if parent is None else parent.depth + 1
+
+    @property
+    def placed_count(self):
+        return self.depth
+
+    def __lt__(self, other):
+        return self.depth < other.depth
+
+
+# an empty cell of Board._ids
+EMPTY = -1
+
+
+def index_entry(slot, fits):
+    """
+    What Board needs of a piece: its dense slot (its bit in Board._placed), for each side
+    {(other_piece_id, other_side_id): error}, and its edge_masks
+    """
+    mates = tuple({ (int(f[0]), int(f[1])): f[2] for f in side_fits } for side_fits in fits)
+    return slot, mates, edge_masks(fits)
+
+
+def build_index(ps):
+    """
+    piece_id -> index_entry, with the pieces numbered 0..n-1 so the placed bitset stays n bits whatever the piece ids are
+    """
+    return { piece_id: index_entry(slot, fits) for slot, (piece_id, fits) in enumerate(ps.items()) }
+
+
+def edge_masks(fits):
+    """
+    For each of the 4 orientations, the 4-bit mask of the board sides a piece with these fits shows an edge on
+    """
+    return tuple(sum(1 << side_i for side_i in range(4) if len(fits[(side_i - orientation) % 4]) == 0) for orientation in range(4))
+
+
+@functools.lru_cache(maxsize=None)
+def cell_edge_masks(width, height):
+    """
+    The 4-bit mask of the sides that must be edges, for every cell of a width x height board
+    """
+    masks = np.zeros((height, width), dtype=np.uint8)
+    masks[0, :] |= 1 << TOP
+    masks[height - 1, :] |= 1 << BOTTOM
+    masks[:, 0] |= 1 << LEFT
+    masks[:, width - 1] |= 1 << RIGHT
+    masks.flags.writeable = False
+    return masks
+
+
 class Board(object):
     @staticmethod
     def copy(board):
-        # make a deep copy of each element in the board
-        _board = [list(e) for e in board._board]
-        return Board(board.width, board.height, _board=_board, _placed_piece_ids=set(board._placed_piece_ids))
+        # the grids are small flat arrays, the edge masks are shared
+        return Board(board.width, board.height, _ids=board._ids.copy(), _orientations=board._orientations.copy(),
+                     _placed=board._placed, _count=board._count, _fits=dict(board._fits), _index=board._index)
 
-    def __init__(self, width, height, _board=None, _placed_piece_ids=None) -> None:
+    def __init__(self, width, height, _ids=None, _orientations=None, _placed=0, _count=0, _fits=None, _index=None) -> None:
         self.width = width
         self.height = height
 
-        if _board is not None:
-            self._board = _board
-        else:
-            self._board = []
-            for y in range(self.height):
-                self._board.append([])
-                for x in range(self.width):
-                    self._board[y].append(None)
+        # piece id and orientation of each cell, and a bitset of the placed pieces' slots (see build_index)
+        self._ids = _ids if _ids is not None else np.full((height, width), EMPTY, dtype=np.int32)
+        self._orientations = _orientations if _orientations is not None else np.zeros((height, width), dtype=np.int8)
+        self._placed = _placed
+        self._count = _count
+        self._fits = _fits if _fits is not None else {}
 
-        self._placed_piece_ids = _placed_piece_ids or set()
+        self._cell_edges = cell_edge_masks(width, height)
+        # piece_id -> index_entry, shared by every copy; pieces missing from it get added, with the next slot, the first time they're tried
+        self._index = _index if _index is not None else {}
+        self._placement = None
 
     def __repr__(self) -> str:
         num_digits = math.floor(math.log(self.width * self.height, 10)) + 3
         s = '\n  ' + '-' * num_digits * self.width + '\n'
         for y in range(self.height):
             for x in range(self.width):
-                cell = self._board[y][x]
-                if cell is None:
+                piece_id = self._ids[y, x]
+                if piece_id == EMPTY:
                     spaces = ' ' * (num_digits) + '-'
                     s += spaces
                 else:
-                    piece_id, _, orientation = cell
-                    ori_str = '^>v<'[orientation]
+                    ori_str = '^>v<'[self._orientations[y, x]]
                     s += '{:>{}}{}'.format(piece_id, num_digits, ori_str)
             s += '\n\n'
         return s
@@ -81,109 +165,161 @@ class Board(object):
     def is_available(self, x, y):
         if x < 0 or x >= self.width or y < 0 or y >= self.height:
             return False
-        return self._board[y][x] is None
+        return self._ids[y, x] == EMPTY
+
+    def _lookup(self, piece_id, fits):
+        entry = self._index.get(piece_id)
+        if entry is None:
+            entry = self._index[piece_id] = index_entry(len(self._index), fits)
+        return entry
+
+    def fits_at(self, piece_id, fits, x, y, orientation):
+        """
+        True if the piece can go in (x, y) with this orientation: the cell is free, its edges are where the board's are,
+        and each placed neighbour is in the fits of the side facing it, with its own facing side
+        """
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            return False
+        ids = self._ids
+        if ids[y, x] != EMPTY:
+            return False
 
-    def can_place(self, piece_id, fits, x, y, orientation):
+        slot, mates, masks = self._lookup(piece_id, fits)
+        if (self._placed >> slot) & 1:
+            return False
+        if masks[orientation] != self._cell_edges[y, x]:
+            return False
+
+        orientations = self._orientations
+        if x > 0 and ids[y, x - 1] != EMPTY:
+            if (int(ids[y, x - 1]), (RIGHT - int(orientations[y, x - 1])) % 4) not in mates[(LEFT - orientation) % 4]:
+                return False
+        if x < self.width - 1 and ids[y, x + 1] != EMPTY:
+            if (int(ids[y, x + 1]), (LEFT - int(orientations[y, x + 1])) % 4) not in mates[(RIGHT - orientation) % 4]:
+                return False
+        if y > 0 and ids[y - 1, x] != EMPTY:
+            if (int(ids[y - 1, x]), (BOTTOM - int(orientations[y - 1, x])) % 4) not in mates[(TOP - orientation) % 4]:
+                return False
+        if y < self.height - 1 and ids[y + 1, x] != EMPTY:
+            if (int(ids[y + 1, x]), (TOP - int(orientations[y + 1, x])) % 4) not in mates[(BOTTOM - orientation) % 4]:
+                return False
+        return True
+
+    def can_place(self, piece_id, fits, x, y, orientation, debug=False):
+        """
+        Same as fits_at, with the reason it can't be placed if debug is on
+        """
+        if self.fits_at(piece_id, fits, x, y, orientation):
+            return True, None
+        if not debug:
+            return False, None
+        return False, self._why_not(piece_id, fits, x, y, orientation)
+
+    def _why_not(self, piece_id, fits, x, y, orientation):
         if x < 0 or x >= self.width or y < 0 or y >= self.height:
-            return False, f"Cannot place {piece_id} at ({x}, {y}) because it is outside the board"
+            return f"Cannot place {piece_id} at ({x}, {y}) because it is outside the board"
 
-        if piece_id in self._placed_piece_ids:
-            return False, f"Cannot place {piece_id} at ({x}, {y}) because it has already been placed"
+        slot, mates, masks = self._lookup(piece_id, fits)
+        if (self._placed >> slot) & 1:
+            return f"Cannot place {piece_id} at ({x}, {y}) because it has already been placed"
 
-        if self._board[y][x] is not None:
-            return False, f"Cannot place {piece_id} at ({x}, {y}) because it is already occupied by {self._board[y][x][0]}"
+        if self._ids[y, x] != EMPTY:
+            return f"Cannot place {piece_id} at ({x}, {y}) because it is already occupied by {self._ids[y, x]}"
 
-        sides_that_must_be_edges = self._sides_that_must_be_edges(x, y)
-        for side_i in range(4):
-            expect_edge = side_i in sides_that_must_be_edges
+        expected = int(self._cell_edges[y, x])
+        if masks[orientation] != expected:
+            # the first side that's wrong
+            wrong = masks[orientation] ^ expected
+            side_i = (wrong & -wrong).bit_length() - 1
             rotated_i = (side_i - orientation) % 4
-            fits_i = fits[rotated_i]
-            is_edge = len(fits_i) == 0
-            if not is_edge and expect_edge:
-                return False, f"Cannot place {piece_id} at ({x}, {y}) because side @ index {rotated_i} is not an edge piece"
-            elif is_edge and not expect_edge:
-                return False, f"Cannot place {piece_id} at ({x}, {y}) because side @ index {rotated_i} is an edge but it shouldn't be"
-
-        # check connectivity of neighbors
-        # if we have someone in a space next to us, let's make sure we connect properly to that space
-        if x > 0 and self._board[y][x - 1] is not None:
-            # check left neighbor has a fit
-            neighbor_piece_id, _, _ = self._board[y][x - 1]
-            rotated_i = (LEFT - orientation) % 4
-            fits_i = [f[0] for f in fits[rotated_i]]
-            if neighbor_piece_id not in fits_i:
-                return False, f"Cannot place {piece_id} at ({x}, {y}) because it does not connect to the right neighbor {neighbor_piece_id} (only connects to {fits_i})"
-        if x < self.width - 1 and self._board[y][x + 1] is not None:
-            # check right neighbor has a fit
-            neighbor_piece_id, _, _ = self._board[y][x + 1]
-            rotated_i = (RIGHT - orientation) % 4
-            fits_i = [f[0] for f in fits[rotated_i]]
-            if neighbor_piece_id not in fits_i:
-                return False, f"Cannot place {piece_id} at ({x}, {y}) because it does not connect to the right neighbor {neighbor_piece_id} (only connects to {fits_i})"
-        if y > 0 and self._board[y - 1][x] is not None:
-            # check top neighbor has a fit
-            neighbor_piece_id, _, _ = self._board[y - 1][x]
-            rotated_i = (TOP - orientation) % 4
-            fits_i = [f[0] for f in fits[rotated_i]]
-            if neighbor_piece_id not in fits_i:
-                return False, f"Cannot place {piece_id} at ({x}, {y}) because it does not connect to the right neighbor {neighbor_piece_id} (only connects to {fits_i})"
-        if y < self.height - 1 and self._board[y + 1][x] is not None:
-            # check bottom neighbor has a fit
-            neighbor_piece_id, _, _ = self._board[y + 1][x]
-            rotated_i = (BOTTOM - orientation) % 4
-            fits_i = [f[0] for f in fits[rotated_i]]
-            if neighbor_piece_id not in fits_i:
-                return False, f"Cannot place {piece_id} at ({x}, {y}) because it does not connect to the right neighbor {neighbor_piece_id} (only connects to {fits_i})"
-        return True, None
+            if (expected >> side_i) & 1:
+                return f"Cannot place {piece_id} at ({x}, {y}) because side @ index {rotated_i} is not an edge piece"
+            return f"Cannot place {piece_id} at ({x}, {y}) because side @ index {rotated_i} is an edge but it shouldn't be"
+
+        # the neighbour's id and the side it shows us, for each placed neighbour
+        for (nx, ny, direction) in ((x - 1, y, LEFT), (x + 1, y, RIGHT), (x, y - 1, TOP), (x, y + 1, BOTTOM)):
+            if not (0 <= nx < self.width and 0 <= ny < self.height) or self._ids[ny, nx] == EMPTY:
+                continue
+            neighbor_piece_id = int(self._ids[ny, nx])
+            neighbor_side = (OPPOSITE[direction] - int(self._orientations[ny, nx])) % 4
+            rotated_i = (direction - orientation) % 4
+            if (neighbor_piece_id, neighbor_side) not in mates[rotated_i]:
+                sides_of_neighbor = [t for (p, t) in mates[rotated_i] if p == neighbor_piece_id]
+                if sides_of_neighbor:
+                    return f"Cannot place {piece_id} at ({x}, {y}) because it connects to neighbor {neighbor_piece_id} on side {sides_of_neighbor}, not side {neighbor_side}"
+                return f"Cannot place {piece_id} at ({x}, {y}) because it does not connect to neighbor {neighbor_piece_id} (only connects to {sorted(set(p for (p, _) in mates[rotated_i]))})"
+        return None
 
     def place(self, piece_id, fits, x, y, orientation):
-        self._board[y][x] = (piece_id, fits, orientation)
-        self._placed_piece_ids.add(piece_id)
+        self._ids[y, x] = piece_id
+        self._orientations[y, x] = orientation
+        self._placed |= 1 << self._lookup(piece_id, fits)[0]
+        self._count += 1
+        self._fits[piece_id] = fits
+
+    def remove(self, x, y):
+        piece_id = self._ids[y, x]
+        self._ids[y, x] = EMPTY
+        self._placed &= ~(1 << self._index[int(piece_id)][0])
+        self._count -= 1
+        self._fits.pop(piece_id, None)
+
+    def checkout(self, placement, ps):
+        """
+        Makes the board hold exactly the placements of this chain, undoing and redoing only up from where the chains meet
+        """
+        undo, redo = [], []
+        a, b = self._placement, placement
+        while a is not b:
+            if b is None or (a is not None and a.depth >= b.depth):
+                undo.append(a)
+                a = a.parent
+            else:
+                redo.append(b)
+                b = b.parent
+        for p in undo:
+            self.remove(p.x, p.y)
+        for p in reversed(redo):
+            self.place(p.piece_id, ps[p.piece_id], p.x, p.y, p.orientation)
+        self._placement = placement
 
     @property
     def placed_count(self):
-        return len(self._placed_piece_ids)
-
-    def _sides_that_must_be_edges(self, x, y):
-        sides = []
-        if y == 0:
-            sides.append(TOP)
-        if y == self.height - 1:
-            sides.append(BOTTOM)
-        if x == 0:
-            sides.append(LEFT)
-        if x == self.width - 1:
-            sides.append(RIGHT)
-        return sides
+        return self._count
 
     def __lt__(self, other):
         return self.placed_count < other.placed_count
 
     def get(self, x, y):
-        return self._board[y][x]
+        piece_id = self._ids[y, x]
+        if piece_id == EMPTY:
+            return None
+        return (int(piece_id), self._fits[piece_id], int(self._orientations[y, x]))
 
 
-def build(connectivity=None, input_path=None, output_path=None):
+def build(connectivity=None, input_path=None, output_path=None, stats=None):
     """
     Builds the puzzle
     Takes in either a path to a directory that contains the connectivity graph, or the connectivity graph itself
+    stats, if given, is a dict that gets the expanded node count and the peak frontier size, summed over the corners tried
     TODO: somehow pass the output along
     """
     if connectivity is None:
         print("> Loading connectivity graph...")
-        with open(os.path.join(input_path, 'connectivity.json'), 'r') as f:
-            ps_raw = json.load(f)
+        # the binary graph is used as is, connectivity.json gets parsed into lists of tuples
+        ps = graph.load(input_path)
+    elif isinstance(connectivity, graph.Graph):
+        print("> Using provided connectivity graph...")
+        ps = connectivity
     else:
         print("> Using provided connectivity graph...")
-        ps_raw = connectivity
-
-    ps = {}
-    for piece_id, fits in ps_raw.items():
-        piece_id = int(piece_id)
-        ps[piece_id] = [[], [], [], []]
-        for i in range(4):
-            for other_piece_id, other_side_id, error in fits[i]:
-                ps[piece_id][i].append((other_piece_id, other_side_id, error))
+        ps = {}
+        for piece_id, fits in connectivity.items():
+            piece_id = int(piece_id)
+            ps[piece_id] = [[], [], [], []]
+            for i in range(4):
+                for other_piece_id, other_side_id, error in fits[i]:
+                    ps[piece_id][i].append((other_piece_id, other_side_id, error))
 
     corners = []
     edges = []
@@ -216,7 +352,7 @@ def build(connectivity=None, input_path=None, output_path=None):
 
     for i in range(0, 4):
         try:
-            solution = build_from_corner(ps, start_piece_id=corners[i], edge_length=edge_length)
+            solution = build_from_corner(ps, start_piece_id=corners[i], edge_length=edge_length, stats=stats)
         except Exception as e:
             print(f"Failed to build from corner {i}: {e}")
             continue
@@ -227,69 +363,168 @@ def build(connectivity=None, input_path=None, output_path=None):
         raise Exception("Failed to solve")
     return solution
 
-def build_from_corner(ps, start_piece_id, edge_length):
+def build_from_corner(ps, start_piece_id, edge_length, stats=None):
     print(f"\n===============================\nBuilding from corner {start_piece_id}...")
+    if SEARCH not in ('greedy', 'astar', 'mean', 'beam'):
+        raise Exception(f"Unknown board search {SEARCH}, expected greedy, astar, mean or beam")
+
     start_piece_fits = ps[start_piece_id]
     start_orientation = _orient_start_corner_to_top_left(start_piece_fits)
-    board = Board(width=PUZZLE_WIDTH, height=PUZZLE_HEIGHT)
+    board = Board(width=PUZZLE_WIDTH, height=PUZZLE_HEIGHT, _index=build_index(ps))
 
     x, y = (0, 0)
-    board.place(start_piece_id, start_piece_fits, x, y, start_orientation)
+    if SHARED_BOARD:
+        start = Placement(None, start_piece_id, x, y, start_orientation)
+        board.checkout(start, ps)
+    else:
+        board.place(start_piece_id, start_piece_fits, x, y, start_orientation)
+        start = board
 
     direction = RIGHT
     x += 1
+    initial_push = [start, start_piece_id, start_orientation, x, y, direction, 0]
+
+    if SEARCH == 'beam':
+        return _beam_from_corner(ps, board, initial_push, edge_length, stats)
 
-    priority_q = []
-    initial_push = (board, start_piece_id, start_orientation, x, y, direction)
-    heapq.heappush(priority_q, (0, initial_push))
+    # the error one joint is expected to add, for the cells still empty
+    joint_error = _mean_best_error(ps) * HEURISTIC_WEIGHT if SEARCH == 'astar' else 0
+    total = PUZZLE_WIDTH * PUZZLE_HEIGHT
+
+    priority_q = frontier.new(FRONTIER)
+    priority_q.push(0, initial_push)
 
     iteration = 0
     longest = 0
+    peak = 0
     while priority_q:
-        priority, data = heapq.heappop(priority_q)
-        board, start_piece_id, start_orientation, x, y, direction = data
+        priority, data = priority_q.pop()
+        state = data[0]
+        if SHARED_BOARD:
+            board.checkout(state, ps)
+        else:
+            board = state
         if iteration % 100 == 0:
             print("\n" * 40)
             print(f"Iteration {iteration} with length {board.placed_count}, cost {priority}, longest: {longest}")
             print(board)
 
             if (iteration > MAX_ITERATIONS_TO_FIND_BORDER and longest < edge_length) or iteration > MAX_ITERATIONS:
+                _record(stats, iteration, peak)
                 raise Exception("Too many iterations, I think we chose the wrong corner")
 
-        if board.placed_count == PUZZLE_WIDTH * PUZZLE_HEIGHT:
-            print(f"Placed {PUZZLE_WIDTH * PUZZLE_HEIGHT} pieces in {iteration} iterations")
+        if board.placed_count == total:
+            print(f"Placed {total} pieces in {iteration} iterations")
             break
         elif board.placed_count > longest:
             longest = board.placed_count
 
-        index_of_neighbor_in_direction = (direction - start_orientation) % 4
         iteration += 1
 
-        for neighbor_piece_id, neighbor_side_index, error in ps[start_piece_id][index_of_neighbor_in_direction]:
-            neighbor_orientation = (OPPOSITE[direction] - neighbor_side_index) % 4
-            ok, err = board.can_place(piece_id=neighbor_piece_id, fits=ps[neighbor_piece_id], x=x, y=y, orientation=neighbor_orientation)
-            if ok:
-                next_board = Board.copy(board)
+        for error, data in _expand(ps, board, data):
+            if SEARCH == 'greedy':
+                priority = error
+            elif SEARCH == 'astar':
+                priority = data[6] + (total - board.placed_count - 1) * joint_error
+            else:
+                priority = data[6] / board.placed_count
+            # integer priorities, in the error * 1000 units of the graph
+            priority_q.push(round(priority), data)
+        peak = max(peak, len(priority_q))
+
+    _record(stats, iteration, peak)
+    if board.placed_count == total:
+        print(f"Found solution after {iteration} iterations!")
+        print(board)
+        return board
+    else:
+        raise Exception(f"No solution found after {iteration} iterations, longest found: {longest}")
+
+
+def _beam_from_corner(ps, board, initial_push, edge_length, stats):
+    """
+    Breadth first one placement at a time, keeping the BEAM_WIDTH cheapest boards by summed error at each depth
+    """
+    total = PUZZLE_WIDTH * PUZZLE_HEIGHT
+    beam = [initial_push]
+    iteration = 0
+    peak = 0
+    while beam:
+        if beam[0][0].placed_count == total:
+            if SHARED_BOARD:
+                board.checkout(beam[0][0], ps)
+            else:
+                board = beam[0][0]
+            _record(stats, iteration, peak)
+            print(f"Found solution after {iteration} iterations!")
+            print(board)
+            return board
+
+        children = []
+        for data in beam:
+            if SHARED_BOARD:
+                board.checkout(data[0], ps)
+            else:
+                board = data[0]
+            iteration += 1
+            children.extend(data for _, data in _expand(ps, board, data))
+        peak = max(peak, len(children))
+
+        print(f"Depth {beam[0][0].placed_count}: {len(beam)} boards, {len(children)} children, {iteration} iterations")
+        if iteration > MAX_ITERATIONS:
+            break
+        beam = heapq.nsmallest(BEAM_WIDTH, children, key=lambda data: data[6])
+
+    _record(stats, iteration, peak)
+    raise Exception(f"No solution found after {iteration} iterations, the beam of {BEAM_WIDTH} ran dry")
+
+
+def _expand(ps, board, data):
+    """
+    The (error of the new joint, frontier entry) of every piece that fits the next cell of this entry's board
+    An entry is [state, piece_id, orientation, x, y, direction, summed error], state being a Placement or a Board
+    """
+    state, piece_id, orientation, x, y, direction, cost = data
+    index_of_neighbor_in_direction = (direction - orientation) % 4
+    for neighbor_piece_id, neighbor_side_index, error in ps[piece_id][index_of_neighbor_in_direction]:
+        neighbor_orientation = (OPPOSITE[direction] - neighbor_side_index) % 4
+        if board.fits_at(neighbor_piece_id, ps[neighbor_piece_id], x, y, neighbor_orientation):
+            if ONE_WAY_PENALTY:
+                _, mates, _ = board._lookup(neighbor_piece_id, ps[neighbor_piece_id])
+                if (int(piece_id), index_of_neighbor_in_direction) not in mates[neighbor_side_index]:
+                    error = error * ONE_WAY_PENALTY
+            if SHARED_BOARD:
+                # the next cell is never (x, y), so the board doesn't need the new piece to check it
+                next_state = Placement(state, neighbor_piece_id, x, y, neighbor_orientation)
+                next_board = board
+            else:
+                next_state = next_board = Board.copy(board)
                 next_board.place(neighbor_piece_id, ps[neighbor_piece_id], x, y, neighbor_orientation)
-                next_direction = direction
+            next_direction = direction
+            next_x = x + (1 if next_direction == RIGHT else -1 if next_direction == LEFT else 0)
+            next_y = y + (1 if next_direction == BOTTOM else -1 if next_direction == TOP else 0)
+
+            if not next_board.is_available(next_x, next_y):
+                # if we can't go further in this direction, time to turn
+                next_direction = (direction + 1) % 4
                 next_x = x + (1 if next_direction == RIGHT else -1 if next_direction == LEFT else 0)
                 next_y = y + (1 if next_direction == BOTTOM else -1 if next_direction == TOP else 0)
 
-                if not next_board.is_available(next_x, next_y):
-                    # if we can't go further in this direction, time to turn
-                    next_direction = (direction + 1) % 4
-                    next_x = x + (1 if next_direction == RIGHT else -1 if next_direction == LEFT else 0)
-                    next_y = y + (1 if next_direction == BOTTOM else -1 if next_direction == TOP else 0)
+            yield error, [next_state, neighbor_piece_id, neighbor_orientation, next_x, next_y, next_direction, cost + int(error)]
 
-                data = [next_board, neighbor_piece_id, neighbor_orientation, next_x, next_y, next_direction]
-                heapq.heappush(priority_q, (error, data))
 
-    if board.placed_count == PUZZLE_WIDTH * PUZZLE_HEIGHT:
-        print(f"Found solution after {iteration} iterations!")
-        print(board)
-        return board
-    else:
-        raise Exception(f"No solution found after {iteration} iterations, longest found: {longest}")
+def _mean_best_error(ps):
+    """
+    The mean over every side of its best fit's error
+    """
+    best = [min(int(f[2]) for f in side_fits) for fits in ps.values() for side_fits in fits if len(side_fits) > 0]
+    return sum(best) / len(best) if best else 0
+
+
+def _record(stats, iterations, frontier):
+    if stats is not None:
+        stats['iterations'] = stats.get('iterations', 0) + iterations
+        stats['frontier'] = max(stats.get('frontier', 0), frontier)
 
 
 def _orient_start_corner_to_top_left(p):
@@ -1,22 +1,12 @@
 import os
-import json
 import pathlib
 
+from core import graph
+
 def load_conn():
-    conFile = pathlib.Path('src/data/3con/connectivity.json')
-    # conFile = pathlib.Path('src/test/3con/connectivity.json')
-    with open(conFile, 'r') as f:
-        raw = json.load(f)
-        
-    ps = {}
-    for piece_id, fits in raw.items():
-        piece_id = int(piece_id)
-        ps[piece_id] = [[], [], [], []]
-        for i in range(4):
-            for other_piece_id, other_side_id, error in fits[i]:
-                ps[piece_id][i].append((other_piece_id, other_side_id, error))
-    
-    return ps
+    # the binary graph when there is one, it's memory-mapped rather than parsed
+    return graph.load(pathlib.Path('src/data/3con'))
+    # return graph.load(pathlib.Path('src/test/3con'))
 
 def get_corners(conn):
     corners = []
@@ -0,0 +1,94 @@
+"""
+Content-hash caching for the pipeline steps
+
+Each step keeps a manifest in its output directory, recording for every input the hash it was
+processed from and the outputs it produced. An input is only reprocessed when its content changed
+or one of its outputs went missing. The whole manifest is dropped when the step's tuning parameters change.
+"""
+import os
+import json
+import hashlib
+import pathlib
+
+
+def file_digest(path) -> str:
+    """
+    sha1 of a file's content
+    """
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def files_digest(paths) -> str:
+    """
+    A single sha1 over the names and contents of several files
+    """
+    h = hashlib.sha1()
+    for path in sorted(str(p) for p in paths):
+        h.update(os.path.basename(path).encode('utf-8'))
+        h.update(file_digest(path).encode('utf-8'))
+    return h.hexdigest()
+
+
+def params_digest(params) -> str:
+    """
+    sha1 of a dict of tuning parameters
+    """
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class StageCache(object):
+    def __init__(self, directory, stage, params) -> None:
+        self.path = pathlib.Path(directory).joinpath(f'.{stage}.cache.json')
+        self.stage = stage
+        self.params = params_digest(params)
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get('params') == self.params:
+                self.entries = data.get('entries', {})
+            else:
+                print(f"> Tuning parameters changed, dropping the {stage} cache")
+
+    def fresh(self, key, digest) -> bool:
+        """
+        True if this input was already processed from the same content and all its outputs are still there
+        """
+        entry = self.entries.get(key)
+        is_fresh = entry is not None and entry['digest'] == digest and all(os.path.exists(o) for o in entry['outputs'])
+        if is_fresh:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return is_fresh
+
+    def outputs(self, key):
+        return self.entries[key]['outputs']
+
+    def meta(self, key):
+        """
+        Whatever extra (json-able) data was recorded along with this input
+        """
+        return self.entries[key].get('meta')
+
+    def record(self, key, digest, outputs, meta=None) -> None:
+        self.entries[key] = {'digest': digest, 'outputs': [str(o) for o in outputs], 'meta': meta}
+
+    def prune(self, keys) -> None:
+        """
+        Forget the inputs that are gone
+        """
+        keys = set(keys)
+        self.entries = {k: e for k, e in self.entries.items() if k in keys}
+
+    def save(self) -> None:
+        with open(self.path, 'w') as f:
+            json.dump({'params': self.params, 'entries': self.entries}, f)
+        print(f"> {self.stage} cache: reused {self.hits}, processed {self.misses}")
@@ -1,9 +1,16 @@
 import os
 import json
+import math
+import pathlib
 from typing import List
 import multiprocessing
+import numpy as np
 
-from core import pieces, sides
+from core import pieces, sides, graph
+from core.batch import SideBatch, UNKNOWN_SHAPE
+from core.index import SideIndex
+from core.cache import files_digest, params_digest
+from core.matrix import ErrorMatrix, MATRIX_FILENAME, NO_MATCH
 
 
 # Building the graph took 440.38 seconds
@@ -18,75 +25,403 @@ SOLUTION = [
     # [(3, 3), (2, 1)],
 ]
 
+# only keep the fits within this multiple of a side's best fit
+WORST_MULTIPLIER = 6.0
 
-def build(input_path, output_path):
+# side pairs are scored in blocks of this many x this many sides; memory grows with its square
+BATCH_BLOCK_SIZE = 128
+
+# skip the shifted pass for pairs whose lower bound is already above SIDE_MAX_ERROR_TO_MATCH (see util.error_between_polylines)
+# off: the bound needs the whole unshifted pass first, and bench.py con-bound measures it slower than scoring every pair in full
+BOUNDED_ERRORS = False
+
+# run side pairs through the cheap cascade stages (see core/batch.py) before the full error
+# off until its tolerances in sides.py are tuned: they're heuristics, and only tests/test_batch.py checks them, on a synthetic puzzle
+USE_CASCADE = False
+
+# only re-rank the nearest sides from a KD-tree (see core/index.py) instead of scanning every pair
+# it looks further than INDEX_CANDIDATES until the pruned fits are the exact scan's, but the raw fits below
+# SIDE_MAX_ERROR_TO_MATCH (and so WRITE_MATRIX and rethreshold) still miss the ones that pruning drops anyway
+USE_INDEX = False
+
+# also write the dense error of every side pair to MATRIX_FILENAME (see core/matrix.py),
+# so rethreshold can rebuild the graph with a different SIDE_MAX_ERROR_TO_MATCH or WORST_MULTIPLIER without scoring again
+WRITE_MATRIX = False
+
+# after pruning, only keep the fits the other side lists back ('reciprocal'),
+# or rank the one-way fits behind the mutual ones ('rank'), or leave the fits as they are (None)
+# errors are always saved as scored, the board solver can penalize one-way fits itself (board.ONE_WAY_PENALTY)
+MUTUAL_FITS = None
+
+# with 'rank', a fit the other side doesn't list back is ranked as if its error were this many times higher
+MUTUAL_PENALTY = 2.0
+
+# the graph is saved in binary (see core/graph.py), also export connectivity.json
+JSON_EXPORT = True
+
+# every fit under SIDE_MAX_ERROR_TO_MATCH, before pruning, so new pieces can be merged in later
+MATCHES_FILENAME = 'matches.json'
+
+
+def build(input_path, output_path, incremental=False):
     print("> Loading piece data...")
     ps = pieces.Piece.load_all(input_path, resample=True)
     print("\t ...Loaded")
 
-    with multiprocessing.Pool(processes=8) as pool:
-        results = [pool.apply_async(_find_potential_matches_for_piece, (ps, piece_id)) for piece_id in ps.keys()]
-        out = [r.get() for r in results]
+    if incremental:
+        return _build_incremental(ps, input_path, output_path)
 
-    ps = { piece_id: piece for (piece_id, piece) in out }
+    with _pool(ps) as pool:
+        fits = _score_all(pool, ps.keys())
+        if WRITE_MATRIX:
+            _write_matrix(pool, ps, input_path, output_path)
+
+    for piece_id, piece in ps.items():
+        piece.fits = _prune_fits(piece, fits[piece_id])
     return _save(ps, output_path)
 
 
-def _find_potential_matches_for_piece(ps, piece_id, debug=False):
+# each worker gets the whole piece dataset once, when it starts, rather than with every task
+_worker_ps = None
+_worker_batch = None
+_worker_index = None
+
+
+def _init_worker(ps):
+    global _worker_ps, _worker_batch, _worker_index
+    _worker_ps = ps
+    _worker_batch = SideBatch(ps)
+    _worker_index = SideIndex(_worker_batch) if USE_INDEX else None
+
+
+def _pool(ps, processes=None):
+    return multiprocessing.Pool(processes=processes or os.cpu_count(), initializer=_init_worker, initargs=(ps,))
+
+
+def _score_chunk(args):
+    piece_ids, other_ids = args
+    if SOLUTION:
+        # the debug output renders pairs one at a time
+        return [_score_piece(_worker_ps, piece_id, other_ids) for piece_id in piece_ids], None
+    if _worker_index is not None:
+        # _build_incremental rescores everything with the index on, so other_ids never comes with it
+        return _worker_index.fits_for(piece_ids, max_error=sides.SIDE_MAX_ERROR_TO_MATCH, k=sides.INDEX_CANDIDATES, worst_multiplier=WORST_MULTIPLIER)
+    return _worker_batch.fits_for(piece_ids, other_ids, max_error=sides.SIDE_MAX_ERROR_TO_MATCH, block_size=BATCH_BLOCK_SIZE,
+                                  cascade=USE_CASCADE, bounded=BOUNDED_ERRORS)
+
+
+def _chunks(piece_ids, n):
     """
-    Find other sides that fit with this piece's sides
+    Splits the piece ids into n contiguous ranges of about the same size, none if there are no ids
+    """
+    piece_ids = list(piece_ids)
+    if not piece_ids:
+        return []
+    n = max(1, min(n, len(piece_ids)))
+    size = -(-len(piece_ids) // n)
+    return [piece_ids[i:i + size] for i in range(0, len(piece_ids), size)]
+
+
+def _score_all(pool, piece_ids, other_ids=None):
+    """
+    Scores each piece against the other pieces (all of them by default) on a pool made by _pool
+    Tasks only carry piece id ranges, and only the raw fits come back
+    """
+    chunks = _chunks(piece_ids, 4 * os.cpu_count())
+    out = pool.map(_score_chunk, [(chunk, other_ids) for chunk in chunks])
+
+    counts = [c for (_, c) in out if c is not None]
+    pairs = sum(c['pairs'] for c in counts)
+    scored = sum(c['scored'] for c in counts)
+    if pairs:
+        print(f"> Scored {scored} of {pairs} side pairs, {pairs - scored} ({round(100 * (pairs - scored) / pairs, 1)}%) skipped by shape class, length window and index")
+    if scored and USE_CASCADE:
+        stage1 = sum(c['stage1_rejected'] for c in counts)
+        stage2 = sum(c['stage2_rejected'] for c in counts)
+        print(f"> Cascade rejected {stage1} ({round(100 * stage1 / scored, 1)}%) at stage 1 and {stage2} ({round(100 * stage2 / scored, 1)}%) at stage 2")
+
+    fits = {}
+    for (chunk, _) in out:
+        _merge_fits(fits, chunk)
+    return fits
+
+
+def _merge_fits(fits, scored):
+    """
+    Adds the (piece_id, fits) pairs in scored to the fits already in the dict
+    """
+    for piece_id, piece_fits in scored:
+        if piece_id not in fits:
+            fits[piece_id] = [[], [], [], []]
+        for si in range(4):
+            fits[piece_id][si].extend(piece_fits[si])
+
+
+def _build_incremental(ps, input_path, output_path):
+    """
+    Only scores the side pairs that involve a new or changed piece, and reuses the stored fits of all the others
+    """
+    digests = { piece_id: _piece_digest(input_path, piece_id) for piece_id in ps.keys() }
+    fits = {}
+    new_ids = set(ps.keys())
+
+    store = _load_matches(output_path)
+    if store is not None and USE_INDEX:
+        # a side's nearest candidates depend on every other side, so fits stored from the index would differ
+        # from what a full build finds now; score everything through the index again
+        print("> The side index depends on every piece, rescoring all of them")
+        store = None
+    if store is not None:
+        stored_ids = set(store['digests'].keys())
+        new_ids = set(p for p in ps.keys() if store['digests'].get(p) != digests[p])
+        # pieces that changed or disappeared are dropped, along with every fit that points at them
+        stale = (stored_ids - set(ps.keys())) | new_ids
+        for piece_id in stored_ids - stale:
+            fits[piece_id] = [[tuple(f) for f in side if f[0] not in stale] for side in store['fits'][piece_id]]
+
+    old_ids = [p for p in ps.keys() if p not in new_ids]
+    print(f"> {len(new_ids)} new or changed pieces, {len(old_ids)} unchanged")
+
+    with _pool(ps) as pool:
+        # new x everything, and unchanged x new
+        _merge_fits(fits, _score_all(pool, new_ids).items())
+        _merge_fits(fits, _score_all(pool, old_ids, new_ids).items())
+        if WRITE_MATRIX:
+            _write_matrix(pool, ps, input_path, output_path)
+
+    _save_matches(output_path, digests, fits)
+
+    for piece_id, piece in ps.items():
+        piece.fits = _prune_fits(piece, fits[piece_id])
+    return _save(ps, output_path)
+
+
+def _score_piece(ps, piece_id, other_ids=None, debug=False):
+    """
+    Finds every side of the other pieces (all of them by default) that fits with this piece's sides
+    Returns the unsorted, unpruned fits of each side
     """
     piece = ps[piece_id]
+    fits = [[], [], [], []]
 
     # for all other piece's sides, find the ones that fit with this piece's sides
     for si, side in enumerate(piece.sides):
         if side.is_edge:
             continue
 
-        for other_piece_id, other_piece in ps.items():
+        for other_piece_id in (ps.keys() if other_ids is None else other_ids):
+            other_piece = ps[other_piece_id]
             if other_piece_id == piece_id:
                 continue
 
             for sj, other_side in enumerate(other_piece.sides):
-                if other_side.is_edge:
+                if other_side.is_edge or not sides.complementary(side.shape, other_side.shape):
                     continue
 
                 # for debugging, we can optionally provide side-matches from the actual solution and see how well the algo thinks they fit together
                 part_of_solution = ([(piece_id, si), (other_piece_id, sj)] in SOLUTION) or ([(other_piece_id, sj), (piece_id, si)] in SOLUTION)
 
                 # compute the error between our piece's side and this other piece's side
-                error = side.error_when_fit_with(other_side, render=part_of_solution or debug, debug_str=f'{piece_id}[{si}] vs {other_piece_id}[{sj}]')
+                error = side.error_when_fit_with(other_side, render=part_of_solution or debug, debug_str=f'{piece_id}[{si}] vs {other_piece_id}[{sj}]',
+                                                 max_error=sides.SIDE_MAX_ERROR_TO_MATCH if BOUNDED_ERRORS else None)
                 if error <= sides.SIDE_MAX_ERROR_TO_MATCH:
-                    piece.fits[si].append((other_piece.id, sj, error))
+                    fits[si].append((other_piece.id, sj, error))
 
                 if error > sides.SIDE_MAX_ERROR_TO_MATCH and part_of_solution:
                     raise ValueError(f"Should have matched but didn't: {piece_id}[{si}] vs {other_piece_id}[{sj}]")
 
+    return (piece_id, fits)
+
+
+def _prune_fits(piece, fits, debug=False, worst_multiplier=None):
+    """
+    Sorts each side's fits by error, and only keeps the ones close to the best
+    """
+    worst_multiplier = worst_multiplier or WORST_MULTIPLIER
+    pruned = [[], [], [], []]
+    for si, side in enumerate(piece.sides):
+        if side.is_edge:
+            continue
+
         # make sure we have at least one match
-        if len(piece.fits[si]) == 0:
-            raise Exception(f'Piece {piece_id} side {si} has no matches but is not an edge')
+        if len(fits[si]) == 0:
+            raise Exception(f'Piece {piece.id} side {si} has no matches but is not an edge')
 
         # sort by error
-        piece.fits[si] = sorted(piece.fits[si], key=lambda x: x[2])
-        least_error = piece.fits[si][0][2]
+        pruned[si] = sorted(fits[si], key=lambda x: x[2])
+        least_error = pruned[si][0][2]
 
         # only keep the best matches
-        WORST_MULTIPLIER = 6.0
-        piece.fits[si] = [f for f in piece.fits[si] if f[2] <= least_error * WORST_MULTIPLIER]
+        pruned[si] = [f for f in pruned[si] if f[2] <= least_error * worst_multiplier]
 
-        print(f"Piece {piece_id}[{si}] has {len(piece.fits[si])} matches, best: {least_error}")
+        print(f"Piece {piece.id}[{si}] has {len(pruned[si])} matches, best: {least_error}")
         if debug:
             nth = 8
-            if len(piece.fits[si]) > nth:
-                nth_match_error = piece.fits[si][nth - 1][2]
+            if len(pruned[si]) > nth:
+                nth_match_error = pruned[si][nth - 1][2]
                 print(f"\t1st match error: {least_error} \t ==> {nth}th match error: {nth_match_error} \t ==> ratio: {nth_match_error / least_error}")
 
+    return pruned
+
+
+def _find_potential_matches_for_piece(ps, piece_id, debug=False):
+    """
+    Find other sides that fit with this piece's sides
+    """
+    piece = ps[piece_id]
+    _, fits = _score_piece(ps, piece_id, debug=debug)
+    piece.fits = _prune_fits(piece, fits, debug=debug)
     return (piece_id, piece)
 
 
+def rethreshold(input_path, output_path, max_error=None, worst_multiplier=None):
+    """
+    Rebuilds connectivity.json from the side error matrix with other thresholds, without scoring any pair
+    """
+    path = os.path.join(output_path, MATRIX_FILENAME)
+    if not os.path.exists(path):
+        raise Exception(f"No side error matrix at {path}, build the connectivity with connect.WRITE_MATRIX on first")
+    matrix = ErrorMatrix(path)
+    if not matrix.complete():
+        raise Exception(f"{len(matrix.missing())} tiles of {path} are still missing")
+
+    ps = pieces.Piece.load_all(input_path)
+    max_error = max_error or sides.SIDE_MAX_ERROR_TO_MATCH
+    fits = matrix.fits(max_error)
+    print(f"> Rethresholding {len(matrix)} sides at {max_error}, within {worst_multiplier or WORST_MULTIPLIER}x of the best")
+    for piece_id, piece in ps.items():
+        piece.fits = _prune_fits(piece, fits.get(piece_id, [[], [], [], []]), worst_multiplier=worst_multiplier)
+    return _save(ps, output_path)
+
+
+def _matrix_sides(ps):
+    return [(piece_id, si) for piece_id, piece in ps.items() for si, side in enumerate(piece.sides) if not side.is_edge]
+
+
+def _write_matrix(pool, ps, input_path, output_path):
+    """
+    Fills in the tiles of the side error matrix that aren't on disk yet, each worker writing its own tiles
+    """
+    matrix_sides = _matrix_sides(ps)
+    digest = params_digest({
+        'sides': files_digest(pathlib.Path(input_path).glob('side_*.json')),
+        'SIDE_RESAMPLE_VERTEX_COUNT': sides.SIDE_RESAMPLE_VERTEX_COUNT,
+        'SIDE_MAX_LENGTH_DISCREPANCY': sides.SIDE_MAX_LENGTH_DISCREPANCY,
+    })
+    path = os.path.join(output_path, MATRIX_FILENAME)
+    matrix = ErrorMatrix.open_or_create(path, [p for (p, _) in matrix_sides], [si for (_, si) in matrix_sides], digest)
+    missing = matrix.missing()
+    print(f"> Writing {len(missing)} of {matrix.n_tiles ** 2} tiles of the {len(matrix)} x {len(matrix)} side error matrix")
+    pool.map(_score_tile, [(path, ti, tj) for (ti, tj) in missing])
+
+
+def _score_tile(args):
+    """
+    Computes one tile of the side error matrix, in full: rethresholding needs the errors above the cutoff too
+    """
+    path, ti, tj = args
+    matrix = ErrorMatrix(path, mode='r+')
+    batch = _worker_batch
+    slots = np.flatnonzero(~batch.is_edge)
+    rows, cols = slots[matrix.span(ti)], slots[matrix.span(tj)]
+
+    errors = batch.errors(rows, cols)
+    # same pairs as the sweep skips: tab-tab, blank-blank and a piece with itself
+    row_shape, col_shape = batch.shape[rows][:, None], batch.shape[cols][None]
+    errors[(row_shape != UNKNOWN_SHAPE) & (col_shape != UNKNOWN_SHAPE) & (row_shape == col_shape)] = NO_MATCH
+    errors[batch.piece_ids[rows][:, None] == batch.piece_ids[cols][None]] = NO_MATCH
+    matrix.write_tile(ti, tj, errors)
+
+
+def _piece_digest(directory, piece_id):
+    return files_digest([os.path.join(directory, f"side_{piece_id}_{i}.json") for i in range(4)])
+
+
+def _matches_params():
+    return params_digest({
+        'SIDE_RESAMPLE_VERTEX_COUNT': sides.SIDE_RESAMPLE_VERTEX_COUNT,
+        'SIDE_MAX_ERROR_TO_MATCH': sides.SIDE_MAX_ERROR_TO_MATCH,
+        'SIDE_MAX_LENGTH_DISCREPANCY': sides.SIDE_MAX_LENGTH_DISCREPANCY,
+        'shape_classes': True,  # stores from before tab/blank pruning also hold tab-tab and blank-blank fits
+        'index': [USE_INDEX, sides.INDEX_CANDIDATES],
+        'cascade': [USE_CASCADE, sides.CASCADE_DEPTH_TOLERANCE, sides.CASCADE_AREA_TOLERANCE, sides.CASCADE_NECK_TOLERANCE,
+                    sides.CASCADE_COARSE_POINTS, sides.CASCADE_COARSE_MULTIPLIER],
+    })
+
+
+def _load_matches(directory):
+    """
+    Returns the stored fits, or None if there are none or they were scored with different parameters
+    """
+    path = os.path.join(directory, MATCHES_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        store = json.load(f)
+    if store.get('params') != _matches_params():
+        print("> Matching parameters changed, rebuilding every fit")
+        return None
+    return {
+        'digests': { int(p): d for p, d in store['digests'].items() },
+        'fits': { int(p): f for p, f in store['fits'].items() },
+    }
+
+
+def _save_matches(directory, digests, fits):
+    path = os.path.join(directory, MATCHES_FILENAME)
+    with open(path, 'w') as f:
+        json.dump({'params': _matches_params(), 'digests': digests, 'fits': fits}, f)
+
+
+def mutual_fits(fits, mode=None, penalty=None):
+    """
+    Applies MUTUAL_FITS to {piece_id: [fits of side 0, ..., fits of side 3]}, whose fits are (other_piece_id, other_side_id, error)
+    """
+    mode = mode or MUTUAL_FITS
+    penalty = penalty or MUTUAL_PENALTY
+    listed = set((piece_id, si, f[0], f[1]) for piece_id, piece_fits in fits.items() for si, side_fits in enumerate(piece_fits) for f in side_fits)
+
+    out = {}
+    for piece_id, piece_fits in fits.items():
+        out[piece_id] = [[], [], [], []]
+        for si, side_fits in enumerate(piece_fits):
+            mutual = [(f[0], f[1], piece_id, si) in listed for f in side_fits]
+            if mode == 'reciprocal':
+                # an empty side reads as an edge, so a side without any reciprocal fit keeps its best one
+                out[piece_id][si] = [tuple(f) for (f, m) in zip(side_fits, mutual) if m] or [tuple(f) for f in side_fits[:1]]
+            elif mode == 'rank':
+                ranked = sorted(zip(side_fits, mutual), key=lambda fm: fm[0][2] if fm[1] else fm[0][2] * penalty)
+                out[piece_id][si] = [tuple(f) for (f, _) in ranked]
+            else:
+                raise Exception(f"Unknown MUTUAL_FITS mode {mode}")
+    return out
+
+
+def fan_out(fits):
+    """
+    How many fits each non-edge side has
+    """
+    return [len(side_fits) for piece_fits in fits.values() for side_fits in piece_fits if len(side_fits) > 0]
+
+
+def _print_fan_out(label, counts):
+    counts = sorted(counts)
+    if not counts:
+        return
+    buckets = [('1', 1, 1), ('2-3', 2, 3), ('4-7', 4, 7), ('8-15', 8, 15), ('16+', 16, math.inf)]
+    histogram = ', '.join(f"{name}: {sum(1 for c in counts if lo <= c <= hi)}" for (name, lo, hi) in buckets)
+    print(f"> Fan-out {label}: mean {round(sum(counts) / len(counts), 2)}, median {counts[len(counts) // 2]}, max {counts[-1]} ({histogram})")
+
+
 def _save(pieces, out_directory):
+    if MUTUAL_FITS:
+        fits = { p_id: p.fits for (p_id, p) in pieces.items() }
+        mutual = mutual_fits(fits)
+        _print_fan_out('before the mutual pass', fan_out(fits))
+        _print_fan_out(f'after the mutual pass ({MUTUAL_FITS})', fan_out(mutual))
+        for p_id, p in pieces.items():
+            p.fits = mutual[p_id]
+
     out = { p_id: p.to_dict() for (p_id, p) in pieces.items() }
-    path = os.path.join(out_directory, 'connectivity.json')
-    with open(path, 'w') as f:
-        json.dump(out, f)
+    graph.save(out, out_directory, json_export=JSON_EXPORT)
     return out
@@ -0,0 +1,81 @@
+"""
+Priority queues for the board solver's frontier
+
+Both pop the lowest priority first and, among equal priorities, the entry pushed first,
+so the items themselves are never compared
+"""
+import heapq
+import itertools
+from collections import deque
+
+
+class HeapFrontier(object):
+    """
+    heapq over (priority, insertion count, item)
+    """
+    def __init__(self) -> None:
+        self._heap = []
+        self._counter = itertools.count()
+
+    def push(self, priority, item) -> None:
+        heapq.heappush(self._heap, (priority, next(self._counter), item))
+
+    def pop(self):
+        """
+        (priority, item) of the lowest priority
+        """
+        priority, _, item = heapq.heappop(self._heap)
+        return priority, item
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+class BucketFrontier(object):
+    """
+    One FIFO bucket per integer priority, and a heap of the priorities that have a bucket
+    Errors are integers (error * 1000) below a few thousand, so the heap stays small however many entries there are,
+    and most pushes and pops only touch a deque
+    """
+    def __init__(self) -> None:
+        self._buckets = {}
+        self._keys = []
+        self._count = 0
+
+    def push(self, priority, item) -> None:
+        bucket = self._buckets.get(priority)
+        if bucket is None:
+            bucket = self._buckets[priority] = deque()
+            heapq.heappush(self._keys, priority)
+        bucket.append(item)
+        self._count += 1
+
+    def pop(self):
+        """
+        (priority, item) of the lowest priority
+        """
+        if self._count == 0:
+            raise IndexError("pop from an empty frontier")
+        priority = self._keys[0]
+        bucket = self._buckets[priority]
+        item = bucket.popleft()
+        if not bucket:
+            del self._buckets[priority]
+            heapq.heappop(self._keys)
+        self._count -= 1
+        return priority, item
+
+    def __len__(self) -> int:
+        return self._count
+
+
+FRONTIERS = {
+    'heap': HeapFrontier,
+    'bucket': BucketFrontier,
+}
+
+
+def new(kind):
+    if kind not in FRONTIERS:
+        raise Exception(f"Unknown frontier {kind}, expected one of {list(FRONTIERS)}")
+    return FRONTIERS[kind]()
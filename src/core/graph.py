@@ -0,0 +1,126 @@
+"""
+The connectivity graph in a compact binary form, next to connectivity.json
+
+Layout (little endian):
+    MAGIC (8 bytes) | header (HEADER_DTYPE) | piece ids (count x int64) | indptr ((4 x count + 1) x int64) | fits (total x FIT_DTYPE)
+
+It's CSR: the fits of piece k's side i are fits[indptr[4k + i]:indptr[4k + i + 1]], in the same order as connectivity.json.
+The file is memory-mapped read-only, so opening it parses nothing and every side's fits are views into the file
+"""
+import os
+import json
+import pathlib
+import numpy as np
+from collections.abc import Mapping
+
+
+MAGIC = b'JIGGRAF\x01'
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('count', '<u8'), ('total', '<u8')])
+
+# error is the same integer as connectivity.json, round(error * 1000)
+FIT_DTYPE = np.dtype([('piece', '<i4'), ('side', '<i4'), ('error', '<i4')])
+
+GRAPH_FILENAME = 'connectivity.graph'
+JSON_FILENAME = 'connectivity.json'
+
+
+class Graph(Mapping):
+    """
+    {piece_id: (fits of side 0, ..., fits of side 3)}, like the dicts loaded from connectivity.json,
+    except each side's fits are a read-only structured array of (piece, side, error) rather than a list of tuples
+    """
+    @staticmethod
+    def write(path, connectivity) -> None:
+        """
+        connectivity is {piece_id: [fits of side 0, ..., fits of side 3]} with (other_piece_id, other_side_id, error) fits
+        """
+        piece_ids = sorted(int(p) for p in connectivity.keys())
+        by_id = { int(p): fits for p, fits in connectivity.items() }
+
+        indptr = [0]
+        fits = []
+        for piece_id in piece_ids:
+            for side_fits in by_id[piece_id]:
+                fits.extend(tuple(f) for f in side_fits)
+                indptr.append(len(fits))
+
+        header = np.array([(MAGIC, len(piece_ids), len(fits))], dtype=HEADER_DTYPE)
+        with open(path, 'wb') as f:
+            f.write(header.tobytes())
+            f.write(np.array(piece_ids, dtype='<i8').tobytes())
+            f.write(np.array(indptr, dtype='<i8').tobytes())
+            f.write(np.array(fits, dtype=FIT_DTYPE).tobytes())
+
+    @staticmethod
+    def from_json(json_path, path) -> 'Graph':
+        with open(json_path, 'r') as f:
+            Graph.write(path, json.load(f))
+        return Graph(path)
+
+    def __init__(self, path) -> None:
+        self.path = pathlib.Path(path)
+        self._mm = np.memmap(self.path, dtype=np.uint8, mode='r')
+
+        header = np.frombuffer(self._mm, dtype=HEADER_DTYPE, count=1)[0]
+        if header['magic'] != MAGIC:
+            raise Exception(f"{path} is not a connectivity graph")
+        count, total = int(header['count']), int(header['total'])
+
+        offset = HEADER_DTYPE.itemsize
+        self.piece_ids = np.frombuffer(self._mm, dtype='<i8', count=count, offset=offset)
+        offset += 8 * count
+        self.indptr = np.frombuffer(self._mm, dtype='<i8', count=4 * count + 1, offset=offset)
+        offset += 8 * (4 * count + 1)
+        self.fits = np.frombuffer(self._mm, dtype=FIT_DTYPE, count=total, offset=offset)
+
+        self._by_id = {int(p): k for k, p in enumerate(self.piece_ids)}
+        self._views = [None] * count
+
+    def __getitem__(self, piece_id):
+        k = self._by_id[piece_id]
+        if self._views[k] is None:
+            ptr = self.indptr[4 * k:4 * k + 5]
+            self._views[k] = tuple(self.fits[ptr[i]:ptr[i + 1]] for i in range(4))
+        return self._views[k]
+
+    def __iter__(self):
+        return iter(self._by_id)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, piece_id) -> bool:
+        return piece_id in self._by_id
+
+    def to_dict(self):
+        """
+        The graph as connectivity.json holds it
+        """
+        return { piece_id: [fits.tolist() for fits in self[piece_id]] for piece_id in self }
+
+
+def save(connectivity, directory, json_export=True) -> None:
+    Graph.write(os.path.join(directory, GRAPH_FILENAME), connectivity)
+    if json_export:
+        with open(os.path.join(directory, JSON_FILENAME), 'w') as f:
+            json.dump(connectivity, f)
+
+
+def load(directory):
+    """
+    The binary graph if there is one, otherwise connectivity.json, as {piece_id: [fits of each side]}
+    """
+    path = os.path.join(directory, GRAPH_FILENAME)
+    if os.path.exists(path):
+        return Graph(path)
+
+    with open(os.path.join(directory, JSON_FILENAME), 'r') as f:
+        raw = json.load(f)
+    ps = {}
+    for piece_id, fits in raw.items():
+        piece_id = int(piece_id)
+        ps[piece_id] = [[], [], [], []]
+        for i in range(4):
+            for other_piece_id, other_side_id, error in fits[i]:
+                ps[piece_id][i].append((other_piece_id, other_side_id, error))
+    return ps
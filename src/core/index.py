@@ -0,0 +1,106 @@
+"""
+Approximate nearest-neighbour index over the resampled sides
+
+Each side is embedded as its polyline, centered on its mean and flattened, so that the
+L1 distance between two embeddings is close to util.error_between_polylines before it divides by the length.
+A KD-tree over the column sides (vertices_flipped) answers the k nearest candidates of each row side (vertices),
+and only those candidates are re-ranked with the exact error
+
+The distance is also at most twice the error before it divides by the length (the mean is never more than twice
+as far from the differences as the best shift), so a side left out of the candidates scores at least
+its distance / (2 * the longest v_length) - which is what lets fits_for guarantee the fits that pruning keeps
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+from core import sides
+from core.batch import SideBatch, UNKNOWN_SHAPE
+
+
+def _embed(polylines):
+    """
+    (n, v, 2) polylines -> (n, 2v) descriptors, centered so the mean shift of the error doesn't count
+    """
+    return (polylines - polylines.mean(axis=1, keepdims=True)).reshape(len(polylines), -1)
+
+
+class SideIndex(object):
+    def __init__(self, batch: SideBatch) -> None:
+        """
+        Builds one tree per shape class of column sides, so tabs are only ever looked up among blanks
+        """
+        self.batch = batch
+        self.rows = _embed(batch.vertices)
+        cols = _embed(batch.vertices_flipped)
+
+        self.trees = {}
+        usable = ~batch.is_edge
+        for shape in (sides.TAB, sides.BLANK, UNKNOWN_SHAPE):
+            members = np.flatnonzero(usable & (batch.shape == shape))
+            if len(members):
+                self.trees[shape] = (members, cKDTree(cols[members]), batch.v_length[members].max())
+
+    def candidates(self, rows, shapes, k):
+        """
+        The k nearest column sides of each row side, among the given shape classes
+        Returns parallel arrays of (row, col), and for each row the lowest error any side left out could have
+        """
+        found_rows, found_cols = [], []
+        unseen = np.full(len(rows), np.inf)
+        for shape in shapes:
+            if shape not in self.trees:
+                continue
+            members, tree, v_length = self.trees[shape]
+            kk = min(k, len(members))
+            distances, nearest = tree.query(self.rows[rows], k=kk, p=1)
+            distances, nearest = distances.reshape(len(rows), kk), nearest.reshape(len(rows), kk)
+            found_rows.append(np.repeat(rows, kk))
+            found_cols.append(members[nearest.reshape(-1)])
+            if kk < len(members):
+                unseen = np.minimum(unseen, distances[:, -1] / (2 * v_length))
+        if not found_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), unseen
+        return np.concatenate(found_rows), np.concatenate(found_cols), unseen
+
+    def fits_for(self, piece_ids, max_error=sides.SIDE_MAX_ERROR_TO_MATCH, k=sides.INDEX_CANDIDATES, worst_multiplier=None):
+        """
+        Same as SideBatch.fits_for against every piece, but only the k nearest sides of each side get the exact error
+        Fits that aren't among the nearest are missed, which bench.py con-ann measures
+        With worst_multiplier, k keeps doubling for the sides whose left out candidates could still be within
+        worst_multiplier of their best, so the fits connect._prune_fits keeps are the same as the exact scan's
+        """
+        batch = self.batch
+        rows = np.isin(batch.piece_ids, list(piece_ids)) & ~batch.is_edge
+        cols = int((~batch.is_edge).sum())
+        counts = {'pairs': int(rows.sum()) * cols, 'scored': 0, 'stage1_rejected': 0, 'stage2_rejected': 0, 'full': 0}
+
+        found = {}
+        for row_shape, col_shapes in ((sides.TAB, (sides.BLANK, UNKNOWN_SHAPE)), (sides.BLANK, (sides.TAB, UNKNOWN_SHAPE)),
+                                      (UNKNOWN_SHAPE, (sides.TAB, sides.BLANK, UNKNOWN_SHAPE))):
+            pending, kk = np.flatnonzero(rows & (batch.shape == row_shape)), k
+            while len(pending):
+                r, c, unseen = self.candidates(pending, col_shapes, kk)
+                error = batch.pair_errors(r, c)
+                counts['scored'] += len(error)
+                counts['full'] += len(error)
+
+                error[batch.piece_ids[r] == batch.piece_ids[c]] = np.inf
+                for row in pending:
+                    found.pop(row, None)
+                for m in np.flatnonzero(error <= max_error):
+                    found.setdefault(r[m], []).append((c[m], float(error[m])))
+                if worst_multiplier is None:
+                    break
+
+                # the rows whose best so far leaves room for a closer fit among the sides not looked at yet
+                best = np.full(len(pending), np.inf)
+                np.minimum.at(best, np.searchsorted(pending, r), error)
+                pending, kk = pending[unseen <= np.minimum(best * worst_multiplier, max_error)], kk * 2
+
+        fits = { piece_id: [[], [], [], []] for piece_id in piece_ids }
+        for row, hits in found.items():
+            # back in piece order, like a plain scan would find them
+            fits[int(batch.piece_ids[row])][int(batch.side_ids[row])] = [
+                (int(batch.piece_ids[col]), int(batch.side_ids[col]), error) for (col, error) in sorted(hits, key=lambda h: h[0])]
+
+        return [(piece_id, fits[piece_id]) for piece_id in piece_ids], counts
@@ -0,0 +1,150 @@
+"""
+The dense error of every non-edge side against every other, on disk
+
+Layout (little endian):
+    MAGIC (8 bytes) | header (HEADER_DTYPE) | sides (count x SIDE_DTYPE) | done flags (one byte per tile) | tiles
+
+Tiles are tile x tile float16 blocks stored one after the other, row of tiles by row of tiles, so each one can
+be computed and flushed on its own, and the file is memory-mapped, so reading a side's row only touches its row of tiles.
+Errors are rounded to float16 (about 3 significant digits); pairs that can never fit hold NO_MATCH
+"""
+import os
+import pathlib
+import numpy as np
+
+
+MAGIC = b'JIGERRS\x01'
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('count', '<u8'), ('tile', '<u8'), ('digest', 'S40')])
+SIDE_DTYPE = np.dtype([('piece_id', '<i8'), ('side_id', '<i8')])
+
+MATRIX_FILENAME = 'side_errors.bin'
+
+# rows and columns of sides per tile: a 256 x 256 tile is 128 KB
+TILE_SIZE = 256
+
+# what error_when_fit_with returns for pairs that can never fit
+NO_MATCH = 1000
+
+
+class ErrorMatrix(object):
+    @staticmethod
+    def create(path, piece_ids, side_ids, digest, tile=TILE_SIZE) -> 'ErrorMatrix':
+        """
+        Lays out an empty matrix for these sides, every tile still to be computed
+        digest identifies the side data, so a matrix of different sides is never resumed
+        """
+        count = len(piece_ids)
+        n_tiles = -(-count // tile)
+        header = np.array([(MAGIC, count, tile, digest.encode('utf-8'))], dtype=HEADER_DTYPE)
+        index = np.array(list(zip(piece_ids, side_ids)), dtype=SIDE_DTYPE)
+        with open(path, 'wb') as f:
+            f.write(header.tobytes())
+            f.write(index.tobytes())
+            f.write(bytes(n_tiles * n_tiles))
+            # sparse on most file systems, the tiles get filled in as they're computed
+            f.truncate(f.tell() + n_tiles * n_tiles * tile * tile * np.dtype('<f2').itemsize)
+        return ErrorMatrix(path, mode='r+')
+
+    @staticmethod
+    def open_or_create(path, piece_ids, side_ids, digest, tile=TILE_SIZE) -> 'ErrorMatrix':
+        """
+        Resumes the matrix at path if it holds the same sides, or starts a new one
+        """
+        if os.path.exists(path):
+            matrix = ErrorMatrix(path, mode='r+')
+            if (matrix.digest == digest and matrix.tile == tile and list(matrix.sides['piece_id']) == list(piece_ids)
+                    and list(matrix.sides['side_id']) == list(side_ids)):
+                return matrix
+            del matrix
+        return ErrorMatrix.create(path, piece_ids, side_ids, digest, tile)
+
+    def __init__(self, path, mode='r') -> None:
+        self.path = pathlib.Path(path)
+        self._mm = np.memmap(self.path, dtype=np.uint8, mode=mode)
+
+        header = np.frombuffer(self._mm, dtype=HEADER_DTYPE, count=1)[0]
+        if header['magic'] != MAGIC:
+            raise Exception(f"{path} is not a side error matrix")
+        self.count = int(header['count'])
+        self.tile = int(header['tile'])
+        self.digest = header['digest'].decode('utf-8')
+        self.n_tiles = -(-self.count // self.tile)
+
+        offset = HEADER_DTYPE.itemsize
+        self.sides = np.frombuffer(self._mm, dtype=SIDE_DTYPE, count=self.count, offset=offset)
+        offset += SIDE_DTYPE.itemsize * self.count
+        self._done = self._mm[offset:offset + self.n_tiles * self.n_tiles].reshape(self.n_tiles, self.n_tiles)
+        offset += self.n_tiles * self.n_tiles
+        self._tiles = self._mm[offset:].view('<f2').reshape(self.n_tiles, self.n_tiles, self.tile, self.tile)
+        self._by_side = {(int(p), int(s)): i for i, (p, s) in enumerate(self.sides)}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def missing(self):
+        """
+        The (ti, tj) of every tile not computed yet
+        """
+        return [(int(ti), int(tj)) for (ti, tj) in zip(*np.nonzero(self._done == 0))]
+
+    def complete(self) -> bool:
+        return bool(self._done.all())
+
+    def span(self, t):
+        """
+        The side indices covered by tile row or column t
+        """
+        return np.arange(t * self.tile, min((t + 1) * self.tile, self.count))
+
+    def write_tile(self, ti, tj, errors) -> None:
+        """
+        Stores a (len(span(ti)), len(span(tj))) block of errors and flushes it, then marks the tile done
+        """
+        rows, cols = np.shape(errors)
+        self._tiles[ti, tj, :rows, :cols] = np.minimum(errors, NO_MATCH)
+        self._mm.flush()
+        self._done[ti, tj] = 1
+        self._mm.flush()
+
+    def block(self, ti):
+        """
+        All the errors of tile row ti, as a (len(span(ti)), count) float32 array
+        """
+        rows = len(self.span(ti))
+        block = np.concatenate([self._tiles[ti, tj, :rows] for tj in range(self.n_tiles)], axis=1)
+        return block[:, :self.count].astype(np.float32)
+
+    def row(self, piece_id, side_id):
+        """
+        The errors of one side against every side, as a float32 array
+        """
+        i = self._by_side[(piece_id, side_id)]
+        ti, r = divmod(i, self.tile)
+        return np.concatenate([self._tiles[ti, tj, r] for tj in range(self.n_tiles)])[:self.count].astype(np.float32)
+
+    def matches(self, piece_id, side_id, max_error, k=None):
+        """
+        The sides within max_error of one side, best first, at most k of them: [(other_piece_id, other_side_id, error)]
+        """
+        if (piece_id, side_id) not in self._by_side:
+            return []
+        return self._pick(self.row(piece_id, side_id), max_error, k)
+
+    def fits(self, max_error, k=None):
+        """
+        Every side's fits within max_error, best first and at most k of them, one tile row at a time
+        Returns {piece_id: [fits of side 0, ..., fits of side 3]}
+        """
+        fits = { int(p): [[], [], [], []] for p in np.unique(self.sides['piece_id']) }
+        for ti in range(self.n_tiles):
+            for r, errors in zip(self.span(ti), self.block(ti)):
+                piece_id, side_id = (int(v) for v in self.sides[r])
+                fits[piece_id][side_id] = self._pick(errors, max_error, k)
+        return fits
+
+    def _pick(self, errors, max_error, k):
+        under = np.flatnonzero(errors <= max_error)
+        under = under[np.argsort(errors[under], kind='stable')]
+        if k is not None:
+            under = under[:k]
+        return [(int(self.sides[c]['piece_id']), int(self.sides[c]['side_id']), float(errors[c])) for c in under]
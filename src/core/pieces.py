@@ -23,7 +23,11 @@ class Piece(object):
             path = os.path.join(directory, f"side_{id}_{side_index}.json")
             with open(path, "r") as f:
                 data = json.load(f)
-            side = sides.Side(piece_id=id, side_id=side_index, vertices=np.array(data['vertices']), piece_center=data['piece_center'], is_edge=data['is_edge'], resample=resample)
+            # sides vectorized before shape classes existed get classified here, while their vertices are still in piece space
+            shape = data.get('shape')
+            if shape is None:
+                shape = sides.shape_class(data['vertices'], data['piece_center'], data['is_edge'])
+            side = sides.Side(piece_id=id, side_id=side_index, vertices=np.array(data['vertices']), piece_center=data['piece_center'], is_edge=data['is_edge'], resample=resample, shape=shape)
             sides_list.append(side)
         piece = cls(id=id, is_edge=False, sides=sides_list)
         return piece
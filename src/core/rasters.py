@@ -0,0 +1,129 @@
+"""
+A single bit-packed container for all the segmented piece rasters of a session
+
+Layout (little endian):
+    MAGIC (8 bytes) | count (uint64) | index (count x INDEX_DTYPE) | rows of every piece, np.packbits'ed
+
+The file is memory-mapped, so loading one piece only touches its own bytes
+"""
+import os
+import re
+import hashlib
+import pathlib
+import numpy as np
+
+from core import util
+
+
+MAGIC = b'JIGPACK\x01'
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('count', '<u8')])
+
+# bbox is the (x, y, w, h) of the piece in photo space, origin is the (x, y) of the raster's top-left in photo space
+# pieces converted from bitmaps have no photo, so their origin is (0, 0)
+INDEX_DTYPE = np.dtype([
+    ('id', '<i8'),
+    ('name', 'S32'),
+    ('width', '<u4'),
+    ('height', '<u4'),
+    ('bbox', '<i4', (4,)),
+    ('origin', '<i4', (2,)),
+    ('offset', '<u8'),
+    ('nbytes', '<u8'),
+])
+
+PACK_FILENAME = 'pieces.pack'
+
+
+class RasterPack(object):
+    @staticmethod
+    def write(path, pieces) -> None:
+        """
+        pieces is an iterable of (id, name, pixels, bbox, origin), where pixels is a 2D array of 0s and 1s
+        """
+        index = []
+        rows = []
+        offset = 0
+        for (id, name, pixels, bbox, origin) in pieces:
+            packed = np.packbits(np.asarray(pixels) != 0, axis=1)
+            height, width = np.shape(pixels)
+            index.append((id, name.encode('utf-8'), width, height, bbox, origin, offset, packed.nbytes))
+            rows.append(packed)
+            offset += packed.nbytes
+
+        header = np.array([(MAGIC, len(index))], dtype=HEADER_DTYPE)
+        index = np.array(index, dtype=INDEX_DTYPE)
+        with open(path, 'wb') as f:
+            f.write(header.tobytes())
+            f.write(index.tobytes())
+            for packed in rows:
+                f.write(packed.tobytes())
+
+    @staticmethod
+    def from_bmp_dir(directory, path, piece_id) -> 'RasterPack':
+        """
+        Converts a directory of segmented piece bitmaps into a single pack
+        piece_id maps a bitmap's filename to its piece id
+        """
+        bmps = sorted(f for f in os.listdir(directory) if re.match(r'.*\.bmp', f))
+
+        def _pieces():
+            for f in bmps:
+                mask, width, height, _ = util.load_bmp_as_binary_mask(pathlib.Path(directory).joinpath(f))
+                ys, xs = np.nonzero(mask)
+                bbox = (xs.min(), ys.min(), xs.max() - xs.min() + 1, ys.max() - ys.min() + 1) if len(xs) else (0, 0, width, height)
+                yield (piece_id(f), f, mask, bbox, (0, 0))
+
+        RasterPack.write(path, _pieces())
+        print(f"Packed {len(bmps)} bitmaps from {directory} into {path}")
+        return RasterPack(path)
+
+    def __init__(self, path) -> None:
+        self.path = pathlib.Path(path)
+        self._mm = np.memmap(self.path, dtype=np.uint8, mode='r')
+
+        header = np.frombuffer(self._mm, dtype=HEADER_DTYPE, count=1)[0]
+        if header['magic'] != MAGIC:
+            raise Exception(f"{path} is not a raster pack")
+        count = int(header['count'])
+
+        self.index = np.frombuffer(self._mm, dtype=INDEX_DTYPE, count=count, offset=HEADER_DTYPE.itemsize)
+        self._data_offset = HEADER_DTYPE.itemsize + INDEX_DTYPE.itemsize * count
+        self._by_id = {int(id): i for i, id in enumerate(self.index['id'])}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, id) -> bool:
+        return id in self._by_id
+
+    def ids(self):
+        return list(self._by_id.keys())
+
+    def entry(self, id):
+        if id not in self._by_id:
+            raise KeyError(f"Piece {id} is not in {self.path}")
+        return self.index[self._by_id[id]]
+
+    def name(self, id) -> str:
+        return self.entry(id)['name'].decode('utf-8')
+
+    def digest(self, id) -> str:
+        """
+        sha1 of one piece's size and packed rows, for caching
+        """
+        e = self.entry(id)
+        start = self._data_offset + int(e['offset'])
+        h = hashlib.sha1(f"{int(e['width'])}x{int(e['height'])}".encode('utf-8'))
+        h.update(self._mm[start:start + int(e['nbytes'])].tobytes())
+        return h.hexdigest()
+
+    def load(self, id):
+        """
+        Returns the piece's 2D array of 1s and 0s, width and height, like util.load_bmp_as_binary_pixels
+        """
+        e = self.entry(id)
+        width, height = int(e['width']), int(e['height'])
+        start = self._data_offset + int(e['offset'])
+        packed = self._mm[start:start + int(e['nbytes'])].reshape(height, (width + 7) // 8)
+        pixels = np.unpackbits(packed, axis=1, count=width).astype(np.int8)
+        return pixels, width, height
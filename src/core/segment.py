@@ -0,0 +1,85 @@
+"""
+Step 1: turning a grayscale photo into the contours of the pieces on it
+"""
+import cv2
+import numpy as np
+
+
+# Each preset picks:
+# - filter: how the photo is denoised before Otsu (bilateral, median, gaussian or none)
+# - scale: denoise and threshold a downscaled copy, then bring the mask back to full size
+# - edges: run Canny over the binary mask (canny), or trace the binary mask directly (mask)
+PRESETS = {
+    'bilateral': {'filter': 'bilateral', 'scale': 1.0, 'edges': 'canny'},  # the original pipeline
+    'bilateral-mask': {'filter': 'bilateral', 'scale': 1.0, 'edges': 'mask'},
+    'median': {'filter': 'median', 'scale': 1.0, 'edges': 'mask'},
+    'gaussian': {'filter': 'gaussian', 'scale': 1.0, 'edges': 'mask'},
+    'downscale': {'filter': 'gaussian', 'scale': 0.5, 'edges': 'mask'},
+}
+DEFAULT_PRESET = 'bilateral'
+
+
+def denoise(img, method, diameter):
+    """
+    Smooth out sensor noise while keeping the piece borders
+    """
+    if method == 'bilateral':
+        # bilateralFilter can reduce unwanted noise very well while keeping edges fairly sharp.
+        # However, it is very slow compared to most filters.
+        return cv2.bilateralFilter(img, diameter, 75, 75)
+    if method == 'median':
+        # medianBlur needs an odd aperture
+        return cv2.medianBlur(img, diameter | 1)
+    if method == 'gaussian':
+        return cv2.GaussianBlur(img, (diameter | 1, diameter | 1), 0)
+    if method == 'none':
+        return img
+    raise ValueError(f"Unknown denoise filter: {method}")
+
+
+def binarize(img, params):
+    """
+    Returns a bi-level (binary) mask of a grayscale photo, at the photo's full resolution
+    """
+    preset = PRESETS[params.get('preset', DEFAULT_PRESET)]
+    kernel = np.ones((params['kernel'], params['kernel']), np.uint8)
+
+    src = img
+    if preset['scale'] != 1.0:
+        src = cv2.resize(img, None, fx=preset['scale'], fy=preset['scale'], interpolation=cv2.INTER_AREA)
+
+    src = denoise(src, preset['filter'], params['diameter'])
+
+    # get a bi-level (binary) image out of a grayscale image
+    _, mask = cv2.threshold(src, 0, params['maxval'], cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    if preset['scale'] != 1.0:
+        # scale the mask back up, and cut the interpolated border at half height so it stays binary
+        mask = cv2.resize(mask, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_LINEAR)
+        _, mask = cv2.threshold(mask, params['maxval'] // 2, params['maxval'], cv2.THRESH_BINARY)
+
+    # perform advanced morphological transformations using an erosion and dilation
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    return mask
+
+
+def find_contours(img, params):
+    """
+    Binarize a grayscale photo and return the external contours of everything on it
+    """
+    preset = PRESETS[params.get('preset', DEFAULT_PRESET)]
+    mask = binarize(img, params)
+
+    if preset['edges'] == 'canny':
+        edges = cv2.Canny(mask, 50, 200)
+    else:
+        # tracing the mask directly needs the pieces to be the foreground;
+        # if the photo border is mostly set, the background came out bright, so flip it
+        border = np.concatenate([mask[0], mask[-1], mask[:, 0], mask[:, -1]])
+        if np.count_nonzero(border) > len(border) / 2:
+            mask = cv2.bitwise_not(mask)
+        edges = mask
+
+    contours, hier = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    return contours
@@ -0,0 +1,150 @@
+"""
+Sharded, resumable connectivity
+
+The non-edge sides, sorted by (piece id, side id), are cut into tiles of SHARD_SIZE sides, and shard (i, j) scores
+the sides of tile i against the sides of tile j. Shards only depend on the side data, so any machine can compute any
+of them into a shared directory, and a shard already on disk is never computed again. merge assembles connectivity.json
+once every shard is there.
+"""
+import os
+import re
+import json
+import time
+import pathlib
+import numpy as np
+
+from core import connect, pieces, sides
+from core.cache import files_digest, params_digest
+
+
+# sides per tile, a shard scores up to SHARD_SIZE x SHARD_SIZE side pairs
+SHARD_SIZE = 512
+
+SHARD_DIR = 'shards'
+
+
+def load(input_path):
+    """
+    The pieces in id order, so every machine cuts the same tiles
+    """
+    ps = pieces.Piece.load_all(input_path, resample=True)
+    return dict(sorted(ps.items()))
+
+
+def digest(input_path) -> str:
+    """
+    Identifies the side data and the parameters the shards were scored with
+    """
+    return params_digest({
+        'sides': files_digest(pathlib.Path(input_path).glob('side_*.json')),
+        'matches': connect._matches_params(),
+        'SHARD_SIZE': SHARD_SIZE,
+    })
+
+
+def shards(ps):
+    """
+    Every (i, j) shard, in a fixed order
+    """
+    count = sum(1 for piece in ps.values() for side in piece.sides if not side.is_edge)
+    n = -(-count // SHARD_SIZE)
+    return [(i, j) for i in range(n) for j in range(n)]
+
+
+def parse_selection(selection, total):
+    """
+    '3', '0-15' or 'all' -> the shard indices it covers
+    """
+    if selection in (None, 'all'):
+        return list(range(total))
+    m = re.match(r'^(\d+)(?:-(\d+))?$', selection)
+    if not m:
+        raise Exception(f"Unknown shard selection {selection}, expected n, n-m or all")
+    start = int(m.group(1))
+    end = int(m.group(2)) if m.group(2) else start
+    return [k for k in range(start, end + 1) if k < total]
+
+
+def _path(shard_dir, i, j):
+    return os.path.join(shard_dir, f"shard_{i}_{j}.json")
+
+
+def _done(shard_dir, i, j, data_digest) -> bool:
+    path = _path(shard_dir, i, j)
+    if not os.path.exists(path):
+        return False
+    with open(path, 'r') as f:
+        return json.load(f).get('digest') == data_digest
+
+
+def build(input_path, shard_dir, selection=None, processes=None):
+    """
+    Computes the selected shards that aren't on disk yet
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    ps = load(input_path)
+    all_shards = shards(ps)
+    data_digest = digest(input_path)
+
+    selected = [all_shards[k] for k in parse_selection(selection, len(all_shards))]
+    todo = [(i, j) for (i, j) in selected if not _done(shard_dir, i, j, data_digest)]
+    print(f"> {len(all_shards)} shards, {len(selected)} selected, {len(selected) - len(todo)} already on disk")
+    if not todo:
+        return
+
+    start_time = time.time()
+    with connect._pool(ps, processes) as pool:
+        for k, (i, j) in enumerate(pool.imap_unordered(_score_shard, [(shard_dir, i, j, data_digest) for (i, j) in todo])):
+            print(f"\t shard ({i}, {j}) done, {k + 1}/{len(todo)}")
+    print(f"> Scored {len(todo)} shards in {round(time.time() - start_time, 2)} seconds")
+
+
+def _score_shard(args):
+    """
+    Scores one shard on a connect._pool worker and writes it, through a temporary file so a partial shard never counts
+    """
+    shard_dir, i, j, data_digest = args
+    batch = connect._worker_batch
+    slots = np.flatnonzero(~batch.is_edge)
+    rows = np.zeros(len(batch), dtype=bool)
+    cols = np.zeros(len(batch), dtype=bool)
+    rows[slots[i * SHARD_SIZE:(i + 1) * SHARD_SIZE]] = True
+    cols[slots[j * SHARD_SIZE:(j + 1) * SHARD_SIZE]] = True
+
+    found, _ = batch.found_between(rows, cols, max_error=sides.SIDE_MAX_ERROR_TO_MATCH, block_size=connect.BATCH_BLOCK_SIZE,
+                                   cascade=connect.USE_CASCADE, bounded=connect.BOUNDED_ERRORS)
+    fits = [[int(batch.piece_ids[row]), int(batch.side_ids[row]), int(batch.piece_ids[col]), int(batch.side_ids[col]), error]
+            for row, hits in found.items() for (col, error) in hits]
+
+    path = _path(shard_dir, i, j)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'digest': data_digest, 'shard': [i, j], 'fits': fits}, f)
+    os.replace(path + '.tmp', path)
+    return (i, j)
+
+
+def merge(input_path, shard_dir, output_path):
+    """
+    Assembles connectivity.json from every shard
+    """
+    ps = load(input_path)
+    all_shards = shards(ps)
+    data_digest = digest(input_path)
+
+    missing = [(i, j) for (i, j) in all_shards if not _done(shard_dir, i, j, data_digest)]
+    if missing:
+        raise Exception(f"{len(missing)} of {len(all_shards)} shards are missing or stale, e.g. {missing[:5]}")
+
+    fits = { piece_id: [[], [], [], []] for piece_id in ps.keys() }
+    for (i, j) in all_shards:
+        with open(_path(shard_dir, i, j), 'r') as f:
+            for (piece_id, si, other_piece_id, sj, error) in json.load(f)['fits']:
+                fits[piece_id][si].append((other_piece_id, sj, error))
+    for piece_fits in fits.values():
+        for side_fits in piece_fits:
+            side_fits.sort(key=lambda f: (f[0], f[1]))
+
+    print(f"> Merged {len(all_shards)} shards")
+    for piece_id, piece in ps.items():
+        piece.fits = connect._prune_fits(piece, fits[piece_id])
+    return connect._save(ps, output_path)
@@ -14,13 +14,58 @@ SIDE_MAX_LENGTH_DISCREPANCY = 0.08
 # when we resample a side, we use this many vertices
 SIDE_RESAMPLE_VERTEX_COUNT = 26
 
+# the cascade matcher rejects most pairs with cheap tests before computing the full error
+# stage 1: tab depth, signed area and neck width may differ by at most this fraction of the side's length
+CASCADE_DEPTH_TOLERANCE = 0.2
+CASCADE_AREA_TOLERANCE = 0.1
+CASCADE_NECK_TOLERANCE = 0.2
+# stage 2: the error between polylines downsampled to this many points, scaled up to the full vertex count,
+# may be at most this multiple of SIDE_MAX_ERROR_TO_MATCH
+CASCADE_COARSE_POINTS = 6
+CASCADE_COARSE_MULTIPLIER = 1.5
+
+# the nearest neighbour index (core/index.py) re-ranks this many candidates per side with the exact error
+# lossy on its own: fits outside them are missed, unless fits_for is given the worst_multiplier to widen the search with
+INDEX_CANDIDATES = 32
+
+# side shape classes
+FLAT = 0   # 平, an edge of the puzzle
+TAB = 1    # 凸, sticks out of the piece
+BLANK = 2  # 凹, cuts into the piece
+
+
+def shape_class(vertices, piece_center, is_edge) -> int:
+    """
+    Given a side's vertices in piece space, finds if it is an edge, a tab or a blank:
+    a tab's middle is on the other side of the corner-to-corner line from the piece's center, a blank's is on the same side
+    """
+    if is_edge:
+        return FLAT
+
+    def _is_left(s, e, p):
+        return (e[0] - s[0])*(p[1] - s[1]) - (e[1] - s[1])*(p[0] - s[0]) > 0
+
+    p1, p2 = vertices[0], vertices[-1]
+    middle = vertices[math.floor(len(vertices) / 2)]
+    return TAB if _is_left(p1, p2, piece_center) != _is_left(p1, p2, middle) else BLANK
+
+
+def complementary(shape1, shape2) -> bool:
+    """
+    Tabs only plug into blanks; sides without a known shape could fit anything
+    """
+    if shape1 is None or shape2 is None:
+        return True
+    return {shape1, shape2} == {TAB, BLANK}
+
 
 class Side(object):
-    def __init__(self, piece_id, side_id, vertices, piece_center, is_edge, resample=False, rotate=True, photo_filename=None) -> None:
+    def __init__(self, piece_id, side_id, vertices, piece_center, is_edge, resample=False, rotate=True, photo_filename=None, shape=None) -> None:
         self.piece_id = piece_id
         self.side_id = side_id
         self.piece_center = piece_center
         self.is_edge = is_edge
+        self.shape = shape
         self.vertices = vertices
         self.p1 = vertices[0]
         self.p2 = vertices[-1]
@@ -55,9 +100,19 @@ class Side(object):
     def length(self) -> float:
         return util.distance(self.p1, self.p2)
 
-    def error_when_fit_with(self, side, flip=True, render=False, skip_edges = True, debug_str=None) -> bool:
+    def error_when_fit_with(self, side, flip=True, render=False, skip_edges = True, debug_str=None, max_error=None) -> bool:
         """
         Returns None if no match, or a float representing the similarity of the two sides (1.0 = perfect) if they generally match
+
+        It isn't symmetric: a.error_when_fit_with(b) compares a.vertices to b.vertices_flipped and b.error_when_fit_with(a) compares
+        b.vertices to a.vertices_flipped, and
+         - the error is divided by the other side's v_length
+         - the length check is relative to the other side's length, so pairs near SIDE_MAX_LENGTH_DISCREPANCY can pass one way only
+         - vertices_flipped is shifted so its leftmost point is at x = 0, not its first one, and the y shift is clamped,
+           so the two comparisons aren't just mirror images of each other
+        so connect scores both directions of each pair on their own; bench.py con-symmetry measures how far apart they are
+
+        With max_error, pairs that can't fit stop early and return something above max_error rather than their exact error
         """
         # if render and debug_str:
         #     print(debug_str)
@@ -80,7 +135,7 @@ class Side(object):
         else:  # comparing two sides to see if they belong to the same piece
             polyline2 = side.vertices
 
-        error, shift = util.error_between_polylines(polyline1, polyline2, p1_len=side.v_length)
+        error, shift = util.error_between_polylines(polyline1, polyline2, p1_len=side.v_length, max_error=max_error)
 
         if render and debug_str and error <= SIDE_MAX_ERROR_TO_MATCH:
             print(debug_str)
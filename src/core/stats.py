@@ -0,0 +1,128 @@
+"""
+Analytics of a connectivity graph, to judge thresholds by what they'll cost the board solver before solving
+
+The search tree estimate is the worst case of board.build_from_corner building the border:
+from the corner, every border placement branches into the fits of the side it continues along, restricted to edge pieces
+"""
+import json
+import math
+import numpy as np
+
+from core import board
+from core.config import PUZZLE_WIDTH, PUZZLE_HEIGHT
+
+
+# sides with at least this many fits are reported as blowing up the search
+BLOWUP_FAN_OUT = 16
+
+# error histogram buckets, in connectivity.json units (error * 1000)
+ERROR_BUCKETS = [0, 500, 1000, 1500, 2000, 3000, 4000, 5500, math.inf]
+
+STATS_FILENAME = 'stats.json'
+
+
+def _percentiles(values):
+    if len(values) == 0:
+        return {}
+    p = np.percentile(values, [0, 10, 50, 90, 100])
+    return {'min': float(p[0]), 'p10': float(p[1]), 'median': float(p[2]), 'p90': float(p[3]), 'max': float(p[4]), 'mean': float(np.mean(values))}
+
+
+def _border_sides(fits):
+    """
+    The sides of an edge piece next to its flat side(s): the ones the border search continues along
+    """
+    flat = [i for i in range(4) if len(fits[i]) == 0]
+    return sorted(set((i + d) % 4 for i in flat for d in (1, 3)) - set(flat))
+
+
+def report(connectivity):
+    """
+    connectivity is {piece_id: [fits of side 0, ..., fits of side 3]} with (other_piece_id, other_side_id, error) fits
+    """
+    conn = { int(p): fits for p, fits in connectivity.items() }
+    fan_outs = [len(side_fits) for fits in conn.values() for side_fits in fits if len(side_fits) > 0]
+    errors = [f[2] for fits in conn.values() for side_fits in fits for f in side_fits]
+    best_errors = [min(f[2] for f in side_fits) for fits in conn.values() for side_fits in fits if len(side_fits) > 0]
+
+    edge_ids = set(p for p, fits in conn.items() if any(len(side_fits) == 0 for side_fits in fits))
+    corner_ids = [p for p in edge_ids if sum(1 for side_fits in conn[p] if len(side_fits) == 0) == 2]
+
+    # along the border only edge pieces can be placed
+    border_fan_outs = [sum(1 for f in conn[p][si] if f[0] in edge_ids) for p in edge_ids for si in _border_sides(conn[p])]
+    branching = math.exp(np.mean(np.log(np.maximum(border_fan_outs, 1)))) if border_fan_outs else 1.0
+    edge_length = 2 * (PUZZLE_WIDTH + PUZZLE_HEIGHT) - 4
+
+    corners = []
+    for p in corner_ids:
+        try:
+            orientation = board._orient_start_corner_to_top_left(conn[p])
+        except ValueError:
+            continue
+        first = sum(1 for f in conn[p][(board.RIGHT - orientation) % 4] if f[0] in edge_ids)
+        corners.append({
+            'piece_id': p,
+            'first_fan_out': first,
+            'border_log10_nodes': round(math.log10(max(first, 1)) + (edge_length - 2) * math.log10(branching), 2),
+        })
+
+    blowups = []
+    for p, fits in conn.items():
+        worst = max(len(side_fits) for side_fits in fits)
+        if worst >= BLOWUP_FAN_OUT:
+            blowups.append({'piece_id': p, 'fan_outs': [len(side_fits) for side_fits in fits], 'is_edge': p in edge_ids})
+    blowups.sort(key=lambda b: max(b['fan_outs']), reverse=True)
+
+    histogram = {}
+    for n in fan_outs:
+        histogram[n] = histogram.get(n, 0) + 1
+    error_histogram = np.histogram(errors, bins=ERROR_BUCKETS)[0].tolist() if errors else []
+
+    return {
+        'pieces': len(conn),
+        'edges': len(edge_ids),
+        'corners': len(corner_ids),
+        'fan_out': _percentiles(fan_outs),
+        'fan_out_histogram': { str(n): histogram[n] for n in sorted(histogram) },
+        'error': _percentiles(errors),
+        'best_error': _percentiles(best_errors),
+        'error_histogram': { f"{ERROR_BUCKETS[i]}-{ERROR_BUCKETS[i + 1]}": c for i, c in enumerate(error_histogram) },
+        'border_branching': round(branching, 3),
+        'corners_search': sorted(corners, key=lambda c: c['border_log10_nodes']),
+        'blowups': blowups,
+    }
+
+
+def save(stats, path) -> None:
+    with open(path, 'w') as f:
+        json.dump(stats, f, indent=2)
+
+
+def print_table(stats) -> None:
+    print(f"{stats['pieces']} pieces, {stats['edges']} on the edge, {stats['corners']} corners")
+
+    def _row(name, p):
+        if p:
+            print(f"  {name:<12} {p['min']:>8.1f} {p['p10']:>8.1f} {p['median']:>8.1f} {p['p90']:>8.1f} {p['max']:>8.1f} {p['mean']:>8.1f}")
+
+    print(f"\n  {'':<12} {'min':>8} {'p10':>8} {'median':>8} {'p90':>8} {'max':>8} {'mean':>8}")
+    _row('fan-out', stats['fan_out'])
+    _row('error', stats['error'])
+    _row('best error', stats['best_error'])
+
+    print("\n  fan-out  sides")
+    for n, count in stats['fan_out_histogram'].items():
+        print(f"  {n:>7}  {count:>5} {'#' * min(count, 60)}")
+
+    print("\n  error (x1000)  fits")
+    for bucket, count in stats['error_histogram'].items():
+        print(f"  {bucket:>13}  {count:>5}")
+
+    print(f"\n  border branching factor: {stats['border_branching']}")
+    print(f"  {'corner':>8} {'first fits':>11} {'log10 nodes':>12}")
+    for c in stats['corners_search']:
+        print(f"  {c['piece_id']:>8} {c['first_fan_out']:>11} {c['border_log10_nodes']:>12}")
+
+    print(f"\n  {len(stats['blowups'])} pieces with a side of at least {BLOWUP_FAN_OUT} fits")
+    for b in stats['blowups'][:20]:
+        print(f"  {b['piece_id']:>8} {b['fan_outs']}{' (edge)' if b['is_edge'] else ''}")
@@ -30,18 +30,40 @@ def load_bmp_as_binary_pixels(path):
     """
     Given a bitmap image path, returns a 2D array of 1s and 0s
     """
+    mask, width, height, _ = load_bmp_as_binary_mask(path)
+    return mask.astype(np.int8), width, height
+
+
+def load_bmp_as_binary_mask(path, crop_margin=None, packed=False):
+    """
+    Given a bitmap image path, returns a 2D bool array that is set wherever the pixel is not black
+    RGB(A) pixels are set when any of their first 3 channels is, same as their average being > 0
+    crop_margin: if set, crop to the bounding box of the set pixels, keeping this many blank pixels around it
+    packed: if set, the rows are bit-packed with np.packbits (use the returned width to unpack)
+    Returns the mask, its width and height, and the (x, y) of its top-left corner in the bitmap
+    """
     with Image.open(path) as img:
-        width, height = img.size
-        pixels = np.array(img.getdata())
+        pixels = np.asarray(img)
+
+    if pixels.ndim == 3 and pixels.shape[2] >= 3:
+        mask = np.any(pixels[:, :, :3] > 0, axis=2)
+    else:
+        mask = pixels > 0
 
-        # if the image is RGB or RGBA, convert to binary
-        if type(pixels[0]) not in [np.int64, np.int32] and len(pixels[0]) >= 3:
-            pixels = np.array([sum(p[:3]) / 3 for p in pixels])
+    origin = (0, 0)
+    if crop_margin is not None:
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        if len(rows) > 0:
+            y0, y1 = max(0, rows[0] - crop_margin), min(mask.shape[0], rows[-1] + 1 + crop_margin)
+            x0, x1 = max(0, cols[0] - crop_margin), min(mask.shape[1], cols[-1] + 1 + crop_margin)
+            mask = mask[y0:y1, x0:x1]
+            origin = (int(x0), int(y0))
 
-    # Reshape to 2D and convert to 1s and 0s
-    pixels = pixels.reshape((height, width))
-    binary_pixels = np.where(pixels > 0, 1, 0).astype(np.int8)
-    return binary_pixels, width, height
+    height, width = mask.shape
+    if packed:
+        mask = np.packbits(mask, axis=1)
+    return mask, width, height, origin
 
 
 def get_photo_orientation(img):
@@ -351,9 +373,11 @@ def resample_polyline(polyline, n):
     return [(float(point.x), float(point.y)) for point in points], line_length
 
 
-def error_between_polylines(polyline1, polyline2, p1_len):
+def error_between_polylines(polyline1, polyline2, p1_len, max_error=None):
     """
     Returns the total integrated error between two polylines
+    With max_error, pairs that can't get under it skip the shifted pass and return a lower bound of their error,
+    which is still above max_error; every error under max_error comes out the same
     """
     def _error_between_polylines(p1, p2):
         differences = np.abs(p1 - p2)
@@ -367,6 +391,11 @@ def error_between_polylines(polyline1, polyline2, p1_len):
     # only allow a little bit of y shifting, up to +/- 5 pixels
     error_y = max(-5, min(5, error_y))
 
+    if max_error is not None:
+        bound = min(error, shifted_error_bound(polyline1, polyline2, error, (error_x, error_y)))
+        if bound > max_error * p1_len:
+            return bound / p1_len, (error_x, error_y)
+
     # we often have slight alignment errors because of differences in corner shape
     # find the mean error, and shift by that amount, then recompute
     polyline1_shifted = [(x - error_x, y - error_y) for (x, y) in polyline1]
@@ -374,6 +403,16 @@ def error_between_polylines(polyline1, polyline2, p1_len):
     return min(error, error_shifted) / p1_len, (error_x, error_y)
 
 
+def shifted_error_bound(polyline1, polyline2, error, shift):
+    """
+    A lower bound of the error once polyline1 is shifted, from what the unshifted pass already has:
+    sum |d - s| >= |sum d - n s| for each axis, and >= sum |d| - n |s|
+    """
+    n = len(polyline1)
+    sum_x, sum_y = np.sum(np.asarray(polyline1) - np.asarray(polyline2), axis=0)
+    return max(abs(sum_x - n * shift[0]) + abs(sum_y - n * shift[1]), error - n * (abs(shift[0]) + abs(shift[1])))
+
+
 def distance_to_polyline(point, polyline):
     """
     Returns the distance from a point to a polyline, and that closest point on the polyline
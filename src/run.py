@@ -9,12 +9,33 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--path', default='./data', required=False, help='Data Path, with raw photo images: "raw"', type=str)
     parser.add_argument('--step', default=0, required=False, help='Start processing at this step', type=int)
+    parser.add_argument('--cache', action='store_true', help='Reuse unchanged outputs, and build connectivity incrementally from 3con/matches.json (see solve.solve)')
+    parser.add_argument('--pack', action='store_true', help='Step 1 writes the pieces into a single raster pack instead of bitmaps; at other steps, convert the bitmaps in "1seg" into one first')
+    parser.add_argument('--stats', action='store_true', help='Only report fan-out, errors and the estimated solver cost of the connectivity graph')
+    parser.add_argument('--shards', default=None, help='Only compute these connectivity shards (n, n-m or all) into --shard-dir', type=str)
+    parser.add_argument('--merge-shards', action='store_true', help='Only assemble connectivity.json from the shards in --shard-dir')
+    parser.add_argument('--shard-dir', default=None, help='Directory shared by the machines computing shards, defaults to "3con/shards"', type=str)
+    parser.add_argument('--processes', default=None, help='Worker processes for the shards, defaults to one per cpu', type=int)
+    parser.add_argument('--max-error', default=None, help='Only rebuild connectivity.json from the side error matrix, with this SIDE_MAX_ERROR_TO_MATCH', type=float)
+    parser.add_argument('--worst-multiplier', default=None, help='Only rebuild connectivity.json from the side error matrix, with this WORST_MULTIPLIER', type=float)
     args = parser.parse_args()
 
     start_time = time.time()
 
-    # start solving
-    solve.solve(args.path, args.step)
+    if args.pack and args.step != 1:
+        solve.pack_seg(args.path)
+
+    if args.stats:
+        solve.graph_stats(args.path)
+    elif args.shards:
+        solve.build_shards(args.path, args.shards, args.shard_dir, args.processes)
+    elif args.merge_shards:
+        solve.merge_shards(args.path, args.shard_dir)
+    elif args.max_error or args.worst_multiplier:
+        solve.rethreshold(args.path, args.max_error, args.worst_multiplier)
+    else:
+        # start solving
+        solve.solve(args.path, args.step, cache=args.cache, pack=args.pack)
 
     duration = time.time() - start_time
     print(f"\n\n{util.GREEN}### Ran in {round(duration, 2)} sec ###{util.WHITE}\n")
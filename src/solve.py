@@ -6,7 +6,12 @@ import pathlib
 import numpy as np
 import multiprocessing
 
-from core import connect, util, board
+from concurrent.futures import ThreadPoolExecutor
+
+import core.Vector
+from core import connect, util, board, segment, sides, shards, graph, stats
+from core.cache import StageCache, file_digest, files_digest
+from core.rasters import RasterPack, PACK_FILENAME
 from core.Vector import Vector
 
 RawDir = '0raw'
@@ -19,6 +24,111 @@ RefDir = '5ref'
 pathRaw = pathlib.Path('src/data').joinpath(RawDir)
 pathRef = pathlib.Path('src/data').joinpath(RefDir)
 pathSeg = pathlib.Path('src/data').joinpath(SegDir)
+pathVec = pathlib.Path('src/data').joinpath(VecDir)
+
+# Parameters for the step 1 pipeline
+# crop is (top, bottom, left, right) in pixels, applied before flipping, or None
+# preset is one of segment.PRESETS
+# bmp keeps writing the piece bitmaps in fused or pack mode, as a debug artifact
+# pack writes the pieces into the raster pack instead of one bitmap each
+SEG_PARAMS = {'crop': None, 'kernel': 3, 'diameter': 9, 'maxval': 80, 'preset': segment.DEFAULT_PRESET, 'bmp': False, 'pack': False}
+SEG_NEW_PARAMS = {'crop': (600, 2400, 600, 2400), 'kernel': 5, 'diameter': 5, 'maxval': 120, 'preset': segment.DEFAULT_PRESET, 'bmp': False, 'pack': False}
+
+def _read_photo(srcImg, params):
+    """
+    Read a photo in grayscale, cropped and flipped the way step 1 expects it
+    """
+    # read the image in grayscale
+    # flip it around the y-axis(because the pieces are photoed facing down)
+    img = cv2.imread(str(srcImg), cv2.IMREAD_GRAYSCALE)
+    if params['crop']:
+        top, bottom, left, right = params['crop']
+        img = img[top:bottom, left:right]
+    return cv2.flip(img, 1)
+
+def _segment_photo(args):
+    """
+    Segment one photo and write every piece found on it to the segmentation directory
+    With a vector directory given (fused mode), each contour is vectorized right away instead,
+    and in fused or pack mode the piece bitmaps are only written if params['bmp'] asks for them (for debugging)
+    Runs inside a pool worker, so only the contours and piece boxes travel back
+    """
+    srcImg, segDir, vecDir, cut, params = args
+
+    img = _read_photo(srcImg, params)
+    contours = segment.find_contours(img, params)
+
+    pieces = []
+    for cnt in contours:
+        x, y, w, h = cv2.boundingRect(cnt)
+        # eliminate tiny noise pixels
+        if (w < 100 or h < 100):
+            continue;
+        piece = segDir.joinpath(cut.format(f'{len(pieces):02}'))
+        if _writes_bmp(vecDir, params):
+            cutImg = np.zeros([h+10, w+10])
+            cv2.drawContours(cutImg, [cnt - [x-5, y-5]], -1, (255, 0, 0), 1, maxLevel = 1)
+            cv2.imwrite(str(piece), cutImg)
+
+        if vecDir is not None:
+            v = Vector.from_contour(cnt, _piece_id(piece.name), filename=piece)
+            try:
+                v.process(output_path=vecDir, render=False)
+            except Exception as e:
+                print(f"Error while processing id {v.id} from photo {srcImg}:")
+                raise e
+
+        pieces.append((piece, (x, y, w, h), cnt))
+
+    return srcImg, img.shape, contours, pieces
+
+def _writes_bmp(vecDir, params):
+    return (vecDir is None and not params['pack']) or params['bmp']
+
+def _iter_segmented(jobs, processes=1):
+    """
+    Yields the result of each segmentation job as soon as it is done
+    With more than one process, photos are spread over a pool and come back in completion order
+    """
+    if processes is None or processes <= 1:
+        for job in jobs:
+            yield _segment_photo(job)
+        return
+
+    with multiprocessing.Pool(processes=processes) as pool:
+        for result in pool.imap_unordered(_segment_photo, jobs):
+            yield result
+
+def _write_ref(refImg, shape, contours, pieces):
+    """
+    Draw all the contours of a photo, labelled with their piece index, as a reference image
+    """
+    ref = np.zeros(shape, np.uint8)
+    for idx, (_, (x, y, _, _), _) in enumerate(pieces):
+        cv2.putText(ref, str(idx), (x,y), cv2.FONT_HERSHEY_SIMPLEX, 1, color=(255,0,0))
+    cv2.drawContours(ref, contours, -1, (255, 0, 0), 1, maxLevel=1)
+    cv2.imwrite(str(refImg), ref)
+
+def _segment_outputs(vecDir, params, pieces):
+    """
+    The files a segmentation job leaves behind, so the cache can tell whether they are still there
+    """
+    outputs = []
+    for (piece, _, _) in pieces:
+        if _writes_bmp(vecDir, params):
+            outputs.append(piece)
+        if vecDir is not None:
+            outputs.extend(vecDir.joinpath(f'side_{_piece_id(piece.name)}_{i}.json') for i in range(4))
+    return outputs
+
+def _uncached_jobs(jobs, cache):
+    """
+    Returns the jobs whose photo is new or changed, and the digest of every photo
+    """
+    digests = {str(job[0]): file_digest(job[0]) for job in jobs}
+    cache.prune(digests.keys())
+    todo = [job for job in jobs if not cache.fresh(str(job[0]), digests[str(job[0])])]
+    return todo, digests
 
 '''
 Extract Puzzle Pieces from raw puzzle photos with multiple pieces
@@ -26,127 +136,275 @@ Extract Puzzle Pieces from raw puzzle photos with multiple pieces
 1 - binarize the image
 2 - save to output path
 '''
-def extract_pieces(path):
+def extract_pieces(path, processes=1, preset=None, fused=False, pack=False, cache=False):
     pathRaw = pathlib.Path(path).joinpath(RawDir)
     pathRef = pathlib.Path(path).joinpath(RefDir)
     pathSeg = pathlib.Path(path).joinpath(SegDir)
+    pathVec = pathlib.Path(path).joinpath(VecDir) if fused else None
     photos = [f for f in os.listdir(pathRaw) if re.match(r'.*\.jpe?g', f)]
     # photos = [f for f in os.listdir(pathRaw) if re.match(r'.*38\.jpe?g', f)]
 
-    kernel = np.ones((3, 3), np.uint8)
+    params = dict(SEG_PARAMS, preset=preset or SEG_PARAMS['preset'], pack=pack)
+    jobs = [(pathRaw.joinpath(f), pathSeg, pathVec, pathlib.Path(f).stem + '-{}.bmp', params) for f in photos]
 
     imgs = [];
+    refs = []
+    packed = []
 
-    for file in photos:
-        srcImg = pathRaw.joinpath(file)
-        refImg = pathRef.joinpath(file)
-
-        # read the image in grayscale
-        # flip it around the y-axis(because the pieces are photoed facing down)
-        img = cv2.imread(str(srcImg), cv2.IMREAD_GRAYSCALE)
-        img = cv2.flip(img, 1)
-
-        # bilateralFilter can reduce unwanted noise very well while keeping edges fairly sharp.
-        # However, it is very slow compared to most filters.
-        img = cv2.bilateralFilter(img, 9, 75, 75)
-
-        # get a bi-level (binary) image out of a grayscale image
-        _, img = cv2.threshold(img, 0, 80, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-
-        # perform advanced morphological transformations using an erosion and dilation
-        img = cv2.morphologyEx(img, cv2.MORPH_CLOSE, kernel)
-        img = cv2.morphologyEx(img, cv2.MORPH_OPEN, kernel)
-
-        canny = cv2.Canny(img, 50, 200)
-        contours, hier = cv2.findContours(canny, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-
-        idx = 0
-        cut = srcImg.stem + '-{}.bmp'
-        ref = np.zeros(img.shape)
-        for cnt in contours:
-            x, y, w, h = cv2.boundingRect(cnt)
-            # print(w, h)
-            # eliminate tiny noise pixels
-            if (w < 100 or h < 100):
-                continue;
-            cutImg = np.zeros([h+10, w+10])
-            cv2.drawContours(cutImg, [cnt - [x-5, y-5]], -1, (255, 0, 0), 1, maxLevel = 1)
+    if cache:
+        # only new or changed photos are segmented again, the rest keep their pieces
+        cache = StageCache(pathSeg, 'seg', dict(params, fused=fused))
+        todo, digests = _uncached_jobs(jobs, cache)
+        if pack:
+            redo = set(str(job[0]) for job in todo)
+            packed = _cached_pack_entries(pathSeg.joinpath(PACK_FILENAME), cache, [job for job in jobs if str(job[0]) not in redo])
+        jobs = todo
 
-            piece = pathSeg.joinpath(cut.format(f'{idx:02}'))
-            cv2.imwrite(str(piece), cutImg)
-            cv2.putText(ref, str(idx), (x,y), cv2.FONT_HERSHEY_SIMPLEX, 1, color=(255,0,0))
-            imgs.append([piece, cutImg, [cnt]])
-            idx+=1
+    # reference images are only for us humans, so write them on a side thread
+    with ThreadPoolExecutor(max_workers=1) as refWriter:
+        for srcImg, shape, contours, pieces in _iter_segmented(jobs, processes):
+            refs.append(refWriter.submit(_write_ref, pathRef.joinpath(srcImg.name), shape, contours, pieces))
+            imgs.extend([piece, [cnt]] for (piece, _, cnt) in pieces)
+            print("In " + srcImg.name + ", Found nb pieces: " + str(len(pieces)))
+            if pack:
+                packed.extend(_pack_entry(piece, bbox, cnt) for (piece, bbox, cnt) in pieces)
+            if cache:
+                cache.record(str(srcImg), digests[str(srcImg)], _segment_outputs(pathVec, params, pieces), meta=[p[0].name for p in pieces])
 
-        cv2.drawContours(ref, contours, -1, (255, 0, 0), 1, maxLevel=1)
-        cv2.imwrite(str(refImg), ref)
+    # surface any error raised while writing the references
+    for ref in refs:
+        ref.result()
 
-        # print("In " + file + ", Found nb pieces: " + str(len(contours)))
-        print("In " + file + ", Found nb pieces: " + str(idx))
-        # imgs.append([dstImg, contours])
+    if cache:
+        cache.save()
+
+    if pack:
+        RasterPack.write(pathSeg.joinpath(PACK_FILENAME), packed)
     return imgs
 
-def seg_new(path):
-    kernel = np.ones((5, 5), np.uint8)
+def seg_new(path, processes=1, preset=None, fused=False, pack=False, cache=False):
+    params = dict(SEG_NEW_PARAMS, preset=preset or SEG_NEW_PARAMS['preset'], pack=pack)
+    jobs = []
     for seq in os.listdir(path):
         print(seq)
         imgpath = os.path.join(path, seq)
         imglist = [f for f in os.listdir(imgpath) if re.match(r'.*\.jpe?g', f)]
         for imgFile in imglist:
-            srcImg = os.path.join(imgpath, imgFile)
-            img = cv2.imread(str(srcImg), cv2.IMREAD_GRAYSCALE)
-            img = img[600:2400, 600:2400]
-            img = cv2.flip(img, 1)
-            # bilateralFilter can reduce unwanted noise very well while keeping edges fairly sharp.
-            # However, it is very slow compared to most filters.
-            img = cv2.bilateralFilter(img, 5, 75, 75)
-            # get a bi-level (binary) image out of a grayscale image
-            _, img = cv2.threshold(img, 0, 120, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            # perform advanced morphological transformations using an erosion and dilation
-            img = cv2.morphologyEx(img, cv2.MORPH_CLOSE, kernel)
-            img = cv2.morphologyEx(img, cv2.MORPH_OPEN, kernel)
-            canny = cv2.Canny(img, 50, 200)
-            contours, hier = cv2.findContours(canny, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-            
-            idx = 0
+            srcImg = pathlib.Path(imgpath).joinpath(imgFile)
+            # one piece per photo, so every piece of a photo is saved under the same name
             saveImg = '{}-{}.bmp'.format(seq, imgFile[0:2])
-            for cnt in contours:
-                x, y, w, h = cv2.boundingRect(cnt)
-                if (w < 100 or h < 100):
-                    continue;
-                cutImg = np.zeros([h+10, w+10])
-                cv2.drawContours(cutImg, [cnt - [x-5, y-5]], -1, (255, 0, 0), 1, maxLevel = 1)
-                cv2.imwrite(pathSeg.joinpath(saveImg), cutImg)
-                idx += 1
-                # cnts.append(cnt)
-            if (idx != 1): 
-                print('In {}/{}. Found pieces: {}'.format(seq, imgFile, idx))
-            
-            # contImg = np.zeros([1800, 1800])
-            # cv2.drawContours(contImg, cnts, -1, (255, 0, 0), 1, maxLevel = 1)
-            # cv2.imwrite(pathSeg.joinpath(saveImg), contImg)
+            jobs.append((srcImg, pathSeg, pathVec if fused else None, saveImg, params))
+
+    packed = []
+    if cache:
+        cache = StageCache(pathSeg, 'seg_new', dict(params, fused=fused))
+        todo, digests = _uncached_jobs(jobs, cache)
+        if pack:
+            redo = set(str(job[0]) for job in todo)
+            packed = _cached_pack_entries(pathSeg.joinpath(PACK_FILENAME), cache, [job for job in jobs if str(job[0]) not in redo])
+        jobs = todo
+
+    for srcImg, _, _, pieces in _iter_segmented(jobs, processes):
+        if (len(pieces) != 1):
+            print('In {}/{}. Found pieces: {}'.format(srcImg.parent.name, srcImg.name, len(pieces)))
+        if pack:
+            packed.extend(_pack_entry(piece, bbox, cnt) for (piece, bbox, cnt) in pieces)
+        if cache:
+            cache.record(str(srcImg), digests[str(srcImg)], _segment_outputs(pathVec if fused else None, params, pieces), meta=[p[0].name for p in pieces])
+
+    if cache:
+        cache.save()
+
+    if pack:
+        RasterPack.write(pathSeg.joinpath(PACK_FILENAME), packed)
     return
 
+def _pack_entry(piece, bbox, cnt):
+    """
+    The raster pack entry of a piece: the same outline as its bitmap, plus where it sits in its photo
+    """
+    x, y, w, h = bbox
+    pixels = np.zeros([h+10, w+10], np.uint8)
+    cv2.drawContours(pixels, [cnt - [x-5, y-5]], -1, 1, 1, maxLevel = 1)
+    return (_piece_id(piece.name), piece.name, pixels, bbox, (x-5, y-5))
+
+def _cached_pack_entries(packFile, cache, jobs):
+    """
+    Carries the pack entries of photos that were not segmented again over from the previous pack
+    They are read into memory, since the pack is about to be rewritten
+    """
+    if not packFile.exists():
+        return []
+    old = RasterPack(packFile)
+    entries = []
+    for job in jobs:
+        for name in cache.meta(str(job[0])) or []:
+            id = _piece_id(name)
+            if id not in old:
+                continue
+            pixels, _, _ = old.load(id)
+            e = old.entry(id)
+            entries.append((id, name, pixels, tuple(e['bbox']), tuple(e['origin'])))
+    return entries
+
+def pack_seg(path):
+    """
+    Converts a session's directory of piece bitmaps into a single raster pack
+    """
+    segDir = pathlib.Path(path).joinpath(SegDir)
+    return RasterPack.from_bmp_dir(segDir, segDir.joinpath(PACK_FILENAME), piece_id=_piece_id)
+
+def _piece_id(piece):
+    """
+    '16-24.bmp' => 1624
+    """
+    [x, y] = piece.split('.')[0].split('-')
+    return int('{}{}'.format(x, y))
+
 def _vectorize(args):
     vecDir, segDir, piece = args
-    [x, y] = piece.split('.')[0].split('-')
-    # print(vecDir, piece, int('{}{}'.format(x, y)))
+    # print(vecDir, piece, _piece_id(piece))
     
-    v = Vector.from_file(segDir.joinpath(piece), int('{}{}'.format(x, y)))
+    v = Vector.from_file(segDir.joinpath(piece), _piece_id(piece))
     v.process(output_path=vecDir, render=False)
     return 
-    
-def _find_connectivity(input_path, output_path):
+
+def _vectorize_packed(args):
+    vecDir, packFile, id = args
+    v = Vector.from_file(packFile, id)
+    v.process(output_path=vecDir, render=False)
+    return
+
+def _vec_params():
+    """
+    The tuning constants step 2 output depends on
+    """
+    V = core.Vector
+    return {
+        'SCALAR': V.SCALAR, 'SIMPLIFY_EPSILON': V.SIMPLIFY_EPSILON, 'MERGE_IF_CLOSER_THAN_PX': V.MERGE_IF_CLOSER_THAN_PX,
+        'SIDE_PARALLEL_THRESHOLD_DEG': V.SIDE_PARALLEL_THRESHOLD_DEG, 'CORNER_MIN_ANGLE_DEG': V.CORNER_MIN_ANGLE_DEG,
+        'CORNER_MAX_ANGLE_DEG': V.CORNER_MAX_ANGLE_DEG, 'SIDES_ORTHOGONAL_THRESHOLD_DEG': V.SIDES_ORTHOGONAL_THRESHOLD_DEG,
+        'EDGE_WIDTH_MIN_RATIO': V.EDGE_WIDTH_MIN_RATIO, 'MAX_PIECE_DIMENSIONS': V.MAX_PIECE_DIMENSIONS,
+    }
+
+def _con_params():
+    """
+    The tuning constants step 3 output depends on
+    """
+    return {
+        'SIDE_RESAMPLE_VERTEX_COUNT': sides.SIDE_RESAMPLE_VERTEX_COUNT, 'SIDE_MAX_ERROR_TO_MATCH': sides.SIDE_MAX_ERROR_TO_MATCH,
+        'SIDE_MAX_LENGTH_DISCREPANCY': sides.SIDE_MAX_LENGTH_DISCREPANCY, 'WORST_MULTIPLIER': connect.WORST_MULTIPLIER,
+        'shape_classes': True, 'USE_CASCADE': connect.USE_CASCADE,
+        'CASCADE_DEPTH_TOLERANCE': sides.CASCADE_DEPTH_TOLERANCE, 'CASCADE_AREA_TOLERANCE': sides.CASCADE_AREA_TOLERANCE,
+        'CASCADE_NECK_TOLERANCE': sides.CASCADE_NECK_TOLERANCE, 'CASCADE_COARSE_POINTS': sides.CASCADE_COARSE_POINTS,
+        'CASCADE_COARSE_MULTIPLIER': sides.CASCADE_COARSE_MULTIPLIER,
+        'USE_INDEX': connect.USE_INDEX, 'INDEX_CANDIDATES': sides.INDEX_CANDIDATES,
+        'WRITE_MATRIX': connect.WRITE_MATRIX, 'JSON_EXPORT': connect.JSON_EXPORT,
+        'MUTUAL_FITS': connect.MUTUAL_FITS, 'MUTUAL_PENALTY': connect.MUTUAL_PENALTY,
+    }
+
+def _side_outputs(vecDir, id):
+    return [vecDir.joinpath(f'side_{id}_{i}.json') for i in range(4)]
+
+def _vectorize_all(vecDir, segDir, cache=False):
+    """
+    Step 2: vectorize every segmented piece, from the raster pack if there is one
+    With the cache on, only pieces whose raster is new or changed are vectorized again
+    """
+    packFile = segDir.joinpath(PACK_FILENAME)
+    if packFile.exists():
+        pack = RasterPack(packFile)
+        func = _vectorize_packed
+        work = [([vecDir, packFile, id], str(id), id) for id in pack.ids()]
+        digest = lambda w: pack.digest(w[2])
+    else:
+        func = _vectorize
+        work = [([vecDir, segDir, p], p, _piece_id(p)) for p in os.listdir(segDir) if p.endswith('24.bmp') and p.startswith('16')]
+        digest = lambda w: file_digest(segDir.joinpath(w[1]))
+
+    if cache:
+        cache = StageCache(vecDir, 'vec', _vec_params())
+        digests = {w[1]: digest(w) for w in work}
+        cache.prune(digests.keys())
+        work = [w for w in work if not cache.fresh(w[1], digests[w[1]])]
+
+    with multiprocessing.Pool(processes=os.cpu_count()) as pool:
+        pool.map(func, [w[0] for w in work])
+
+    if cache:
+        for w in work:
+            cache.record(w[1], digests[w[1]], _side_outputs(vecDir, w[2]))
+        cache.save()
+
+def _find_connectivity(input_path, output_path, cache=False):
     """
     Opens each piece data and finds how each piece could connect to others
     """
     print(f"\n{util.RED}### 4 - Building connectivity ###{util.WHITE}\n")
     start_time = time.time()
-    connectivity = connect.build(input_path, output_path)
+
+    if cache:
+        # the graph depends on every side, so it is either reused as a whole or rebuilt
+        cache = StageCache(output_path, 'con', _con_params())
+        digest = files_digest(pathlib.Path(input_path).glob('side_*.json'))
+        conFiles = [pathlib.Path(output_path).joinpath(graph.GRAPH_FILENAME)]
+        if connect.JSON_EXPORT:
+            conFiles.append(pathlib.Path(output_path).joinpath(graph.JSON_FILENAME))
+        if cache.fresh('connectivity', digest):
+            print("> Sides unchanged, reusing the connectivity graph")
+            return graph.load(output_path)
+
+    # with the cache on, only the side pairs involving new or changed pieces are scored
+    connectivity = connect.build(input_path, output_path, incremental=bool(cache))
+
+    if cache:
+        cache.record('connectivity', digest, conFiles)
+        cache.save()
     duration = time.time() - start_time
     print(f"Building the graph took {round(duration, 2)} seconds")
     return connectivity
 
+def rethreshold(path, max_error=None, worst_multiplier=None):
+    """
+    Rebuilds connectivity.json from the side error matrix written by step 3, with different thresholds
+    """
+    print(f"\n{util.RED}### 4 - Rethresholding connectivity ###{util.WHITE}\n")
+    start_time = time.time()
+    vecDir = pathlib.Path(path).joinpath(VecDir)
+    conDir = pathlib.Path(path).joinpath(ConDir)
+    connectivity = connect.rethreshold(vecDir, conDir, max_error=max_error, worst_multiplier=worst_multiplier)
+    print(f"Rethresholding took {round(time.time() - start_time, 2)} seconds")
+    return connectivity
+
+def graph_stats(path):
+    """
+    Reports fan-out, errors and the estimated solver cost of the connectivity graph, to 3con/stats.json and as a table
+    """
+    conDir = pathlib.Path(path).joinpath(ConDir)
+    conn = graph.load(conDir)
+    report = stats.report(conn.to_dict() if isinstance(conn, graph.Graph) else conn)
+    stats.save(report, conDir.joinpath(stats.STATS_FILENAME))
+    stats.print_table(report)
+    return report
+
+def _shard_dir(path, shard_dir):
+    return pathlib.Path(shard_dir) if shard_dir else pathlib.Path(path).joinpath(ConDir, shards.SHARD_DIR)
+
+def build_shards(path, selection=None, shard_dir=None, processes=None):
+    """
+    Computes some shards of the connectivity, e.g. on one of several machines sharing shard_dir
+    """
+    print(f"\n{util.RED}### 4 - Building connectivity shards {selection or 'all'} ###{util.WHITE}\n")
+    shards.build(pathlib.Path(path).joinpath(VecDir), _shard_dir(path, shard_dir), selection, processes)
+
+def merge_shards(path, shard_dir=None):
+    """
+    Assembles connectivity.json once every shard is in shard_dir
+    """
+    print(f"\n{util.RED}### 4 - Merging connectivity shards ###{util.WHITE}\n")
+    conDir = pathlib.Path(path).joinpath(ConDir)
+    return shards.merge(pathlib.Path(path).joinpath(VecDir), _shard_dir(path, shard_dir), conDir)
+
 def _build_board(connectivity, input_path, output_path):
     """
     Searches connectivity to find the solution
@@ -158,7 +416,15 @@ def _build_board(connectivity, input_path, output_path):
     print(f"Finding where each piece goes took {round(duration, 2)} seconds")
     return puzzle
 
-def solve(path, step):
+def solve(path, step, cache=False, pack=False):
+    """
+    Runs one step of the pipeline on the session in path
+    With cache, each step skips the inputs it already processed, by content hash, and keeps a manifest in its output
+    directory (1seg/.seg_new.cache.json, 2vec/.vec.cache.json, 3con/.con.cache.json). Step 3 then also switches to the
+    incremental build: it keeps every fit before pruning in 3con/matches.json and only scores the pairs with a new or
+    changed piece. The manifests and matches.json are only invalidated by the tuning constants they record, so after
+    changing the code of a step rather than its constants, delete them or run without cache
+    """
 
     segDir = pathlib.Path(path).joinpath(SegDir)
     vecDir = pathlib.Path(path).joinpath(VecDir)
@@ -166,16 +432,14 @@ def solve(path, step):
     outDir = pathlib.Path(path).joinpath(OutDir)
 
     if step == 1:
-        # imgs = extract_pieces(path)
-        seg_new('/home/derren/Documents/Misc/monet/OpenCamera/')
+        # imgs = extract_pieces(path, processes=os.cpu_count())
+        seg_new('/home/derren/Documents/Misc/monet/OpenCamera/', processes=os.cpu_count(), pack=pack, cache=cache)
         
     if step == 2:
-        args = [[vecDir, segDir, p] for p in os.listdir(segDir) if p.endswith('24.bmp') and p.startswith('16')]
-        with multiprocessing.Pool(processes=os.cpu_count()) as pool:
-            pool.map(_vectorize, args)
+        _vectorize_all(vecDir, segDir, cache=cache)
 
     if step == 3:
-        conn = _find_connectivity(vecDir, conDir)
+        conn = _find_connectivity(vecDir, conDir, cache=cache)
 
     if step == 4:
         _build_board(connectivity=None, input_path=conDir, output_path=outDir)
@@ -3,7 +3,6 @@ import re
 import cv2
 import time
 import json
-import math
 import pathlib
 import numpy as np
 import multiprocessing
@@ -96,29 +95,14 @@ def _cat_pieces():
         edges = {}
         for side in piece.sides:
             # determine if this edge is inward or outward or flat
-            if (side.is_edge):
-                edges[side.side_id] = 0
-                continue
-            
-            vts = side.vertices
-            if diffSide(side.p1, side.p2, side.piece_center, vts[math.floor(len(vts)/2)]):
-                edges[side.side_id] = 1 # 不相同，此处为凸边
-            else:
-                edges[side.side_id] = 2 # 相同，此处为凹边
+            # 0 平 | 1 凸 | 2 凹, saved with each side when vectorizing
+            edges[side.side_id] = side.shape
 
         result[pid] = [edges[0], edges[1], edges[2], edges[3]]
 
     with open(os.path.join(tmpDir, 'shape.json'), 'w') as f:
         json.dump(result, f)
     return result
-    
-def diffSide(start, end, a, b):
-    aSide = isLeft(start, end, a)
-    bSide = isLeft(start, end, b)
-    return aSide ^ bSide
- 
-def isLeft(s, e, p):
-    return (e[0] - s[0])*(p[1] - s[1]) - (e[1] - s[1])*(p[0] - s[0]) > 0
 
 def _con_border():
     pieces = {}
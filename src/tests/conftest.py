@@ -0,0 +1,95 @@
+"""
+Shared fixtures: a synthetic puzzle written out as step 2 (vectorization) would, with its known solution
+"""
+import os
+import sys
+import json
+import tempfile
+import cv2
+import numpy as np
+import pytest
+
+# the modules import each other as `core.x`, from src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# cell size of the synthetic pieces, in pixels
+CELL = 300
+
+
+def _curve(p, q, rng, flat):
+    """
+    A side from corner p to corner q: a straight line with a tab or blank bump, or only a little wobble if flat
+    """
+    t = np.linspace(0, 1, 60)[:, None]
+    p, q = np.array(p, dtype=float), np.array(q, dtype=float)
+    normal = np.array([q[1] - p[1], p[0] - q[0]]) / np.linalg.norm(q - p)
+    offset = rng.uniform(0.5, 2.0) * np.sin(np.pi * t * rng.integers(1, 4))
+    if not flat:
+        height = rng.uniform(40, 75) * rng.choice([-1, 1])
+        offset = offset + height * np.exp(-((t - rng.uniform(0.35, 0.65)) / rng.uniform(0.08, 0.14)) ** 2)
+    return p + t * (q - p) + offset * normal
+
+
+def write_puzzle(directory, width, height, seed=0):
+    """
+    Writes side_{piece}_{side}.json files for a width x height puzzle cut from a jittered grid
+    Returns the true neighbours, as [((piece_id, side_id), (piece_id, side_id))]
+    """
+    rng = np.random.default_rng(seed)
+    corners = np.stack(np.meshgrid(np.arange(width + 1), np.arange(height + 1), indexing='ij'), axis=-1) * CELL
+    corners = corners + rng.uniform(-12, 12, corners.shape)
+
+    # each cut is shared by the two pieces on either side of it, one going each way
+    horizontal = { (i, j): _curve(corners[i, j], corners[i + 1, j], rng, j in (0, height)) for i in range(width) for j in range(height + 1) }
+    vertical = { (i, j): _curve(corners[i, j], corners[i, j + 1], rng, i in (0, width)) for i in range(width + 1) for j in range(height) }
+
+    def _id(i, j):
+        return 100 + j * width + i
+
+    solution = []
+    for i in range(width):
+        for j in range(height):
+            # clockwise: top, right, bottom, left
+            cuts = [horizontal[(i, j)], vertical[(i + 1, j)], horizontal[(i, j + 1)][::-1], vertical[(i, j)][::-1]]
+            flats = [j == 0, i == width - 1, j == height - 1, i == 0]
+            center = corners[i:i + 2, j:j + 2].reshape(-1, 2).mean(axis=0)
+            for si, (cut, flat) in enumerate(zip(cuts, flats)):
+                vertices = cut + rng.normal(0, 0.5, cut.shape)
+                with open(os.path.join(directory, f"side_{_id(i, j)}_{si}.json"), 'w') as f:
+                    json.dump({'vertices': vertices.tolist(), 'piece_center': center.tolist(), 'is_edge': bool(flat)}, f)
+            if i < width - 1:
+                solution.append(((_id(i, j), 1), (_id(i + 1, j), 3)))
+            if j < height - 1:
+                solution.append(((_id(i, j), 2), (_id(i, j + 1), 0)))
+    return solution
+
+
+def write_photo(path, width, height, seed=0):
+    """
+    Writes a photo of the pieces of a width x height synthetic puzzle, laid out apart from each other, for step 1
+    """
+    directory = tempfile.mkdtemp()
+    write_puzzle(directory, width, height, seed)
+
+    ids = sorted(set(int(f.split('_')[1]) for f in os.listdir(directory)))
+    columns = 4
+    img = np.zeros((150 + 450 * -(-len(ids) // columns), 150 + 500 * columns), np.uint8)
+    for k, piece_id in enumerate(ids):
+        outline = []
+        for si in range(4):
+            with open(os.path.join(directory, f"side_{piece_id}_{si}.json"), 'r') as f:
+                outline.extend(json.load(f)['vertices'][:-1])
+        outline = np.array(outline) - np.min(outline, axis=0) + [100 + (k % columns) * 500, 100 + (k // columns) * 450]
+        cv2.fillPoly(img, [np.round(outline).astype(np.int32)], 220)
+    cv2.imwrite(str(path), img)
+    return ids
+
+
+@pytest.fixture(scope='session')
+def puzzle(tmp_path_factory):
+    """
+    (side directory, solution, width, height) of an 8 x 6 synthetic puzzle
+    """
+    directory = tmp_path_factory.mktemp('2vec')
+    return str(directory), write_puzzle(str(directory), 8, 6, seed=3), 8, 6
@@ -0,0 +1,112 @@
+import copy
+import numpy as np
+import pytest
+
+from core import connect, pieces, sides
+from core.batch import SideBatch, NO_MATCH
+
+
+@pytest.fixture(scope='module')
+def ps(puzzle):
+    directory, _, _, _ = puzzle
+    return pieces.Piece.load_all(directory, resample=True)
+
+
+def _scalar_errors(ps, rows, cols, max_error=None):
+    all_sides = [side for piece in ps.values() for side in piece.sides]
+    return np.array([[all_sides[r].error_when_fit_with(all_sides[c], max_error=max_error) for c in cols] for r in rows])
+
+
+def test_errors_match_error_when_fit_with(ps):
+    batch = SideBatch(ps)
+    rows = np.arange(0, len(batch), 3)
+    cols = np.arange(len(batch))
+    np.testing.assert_allclose(batch.errors(rows, cols), _scalar_errors(ps, rows, cols), rtol=1e-9, atol=1e-12)
+
+
+def test_error_is_not_symmetric(ps, puzzle):
+    """
+    Each way of a pair is scored on its own (see Side.error_when_fit_with): the two come out different
+    """
+    _, solution, _, _ = puzzle
+    batch = SideBatch(ps)
+    row_of = {(int(p), int(si)): row for row, (p, si) in enumerate(zip(batch.piece_ids, batch.side_ids))}
+    rows = np.array([row_of[a] for (a, _) in solution])
+    cols = np.array([row_of[b] for (_, b) in solution])
+    forward, backward = batch.pair_errors(rows, cols), batch.pair_errors(cols, rows)
+    np.testing.assert_allclose(forward, [ps[a[0]].sides[a[1]].error_when_fit_with(ps[b[0]].sides[b[1]]) for (a, b) in solution], rtol=1e-9)
+    np.testing.assert_allclose(backward, [ps[b[0]].sides[b[1]].error_when_fit_with(ps[a[0]].sides[a[1]]) for (a, b) in solution], rtol=1e-9)
+    assert (forward <= sides.SIDE_MAX_ERROR_TO_MATCH).all() and (backward <= sides.SIDE_MAX_ERROR_TO_MATCH).all()
+    assert not np.allclose(forward, backward)
+
+
+def test_length_check_is_one_sided(ps):
+    piece = next(iter(ps.values()))
+    a, b = copy.copy(piece.sides[0]), copy.copy(piece.sides[0])
+    a.is_edge = b.is_edge = False
+    # within SIDE_MAX_LENGTH_DISCREPANCY of b's length, but b isn't within it of a's
+    a.p1, a.p2 = (0, 0), (100.0, 0)
+    b.p1, b.p2 = (0, 0), (100.0 * (1 + sides.SIDE_MAX_LENGTH_DISCREPANCY) + 0.1, 0)
+    assert a.error_when_fit_with(b) < NO_MATCH
+    assert b.error_when_fit_with(a) == NO_MATCH
+
+
+def test_pair_errors_match_errors(ps):
+    batch = SideBatch(ps)
+    rows, cols = np.meshgrid(np.arange(len(batch)), np.arange(len(batch)), indexing='ij')
+    np.testing.assert_allclose(batch.pair_errors(rows.reshape(-1), cols.reshape(-1)), batch.errors(rows[:, 0], cols[0]).reshape(-1), rtol=1e-9)
+
+
+def test_bounded_errors(ps):
+    """
+    With max_error, errors under it are exact and the others stay above it, in both engines
+    """
+    batch = SideBatch(ps)
+    rows = np.arange(0, len(batch), 3)
+    cols = np.arange(len(batch))
+    max_error = 0.5
+    for exact, bounded in ((batch.errors(rows, cols), batch.errors(rows, cols, max_error)),
+                           (_scalar_errors(ps, rows, cols), _scalar_errors(ps, rows, cols, max_error))):
+        under = exact <= max_error
+        assert under.any()
+        np.testing.assert_allclose(bounded[under], exact[under], rtol=1e-9)
+        assert (bounded[~under] > max_error).all()
+        assert (bounded <= exact + 1e-9).all()
+
+
+def test_bounded_fits_for_finds_the_same_fits(ps):
+    assert SideBatch(ps).fits_for(list(ps.keys()), max_error=0.5, bounded=True) == SideBatch(ps).fits_for(list(ps.keys()), max_error=0.5)
+
+
+def test_fits_for_matches_score_piece(ps):
+    batch = SideBatch(ps)
+    found, _ = batch.fits_for(list(ps.keys()), block_size=16)
+    for piece_id, fits in found:
+        _, expected = connect._score_piece(ps, piece_id)
+        for si in range(4):
+            assert [(p, s) for (p, s, _) in fits[si]] == [(p, s) for (p, s, _) in expected[si]]
+            np.testing.assert_allclose([e for (_, _, e) in fits[si]], [e for (_, _, e) in expected[si]], rtol=1e-9)
+
+
+def test_edges_never_fit(ps):
+    batch = SideBatch(ps)
+    edges = np.flatnonzero(batch.is_edge)
+    assert (batch.errors(edges, np.arange(len(batch))) == NO_MATCH).all()
+    assert sides.SIDE_MAX_ERROR_TO_MATCH < NO_MATCH
+
+
+@pytest.mark.parametrize('max_error', [sides.SIDE_MAX_ERROR_TO_MATCH, 1.0, 0.5])
+def test_cascade_matches_the_full_scan(ps, puzzle, max_error):
+    _, solution, _, _ = puzzle
+    batch = SideBatch(ps)
+    full, _ = batch.fits_for(list(ps.keys()), max_error=max_error)
+    cascaded, counts = batch.fits_for(list(ps.keys()), max_error=max_error, cascade=True)
+    assert cascaded == full
+
+    # none of the true neighbours is dropped
+    found = dict(cascaded)
+    for ((p, si), (q, sj)) in solution:
+        assert (q, sj) in [(f[0], f[1]) for f in found[p][si]]
+        assert (p, si) in [(f[0], f[1]) for f in found[q][sj]]
+    if max_error < 1.0:
+        assert counts['stage1_rejected'] + counts['stage2_rejected'] > 0
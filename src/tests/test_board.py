@@ -0,0 +1,67 @@
+import pytest
+
+from core import board, connect
+
+
+@pytest.fixture(scope='module')
+def connectivity(puzzle, tmp_path_factory):
+    directory, _, _, _ = puzzle
+    return connect.build(directory, str(tmp_path_factory.mktemp('3con')))
+
+
+def _solve(connectivity, puzzle, monkeypatch, **settings):
+    _, solution, width, height = puzzle
+    monkeypatch.setattr(board, 'PUZZLE_WIDTH', width)
+    monkeypatch.setattr(board, 'PUZZLE_HEIGHT', height)
+    for setting, value in settings.items():
+        monkeypatch.setattr(board, setting, value)
+    stats = {}
+    solved = board.build(connectivity=connectivity, stats=stats)
+
+    # every pair of placed neighbours is a true pair of neighbours
+    truth = set(solution) | set((b, a) for (a, b) in solution)
+    for y in range(height):
+        for x in range(width):
+            piece_id, _, orientation = solved.get(x, y)
+            for (nx, ny, direction) in ((x + 1, y, board.RIGHT), (x, y + 1, board.BOTTOM)):
+                if nx < width and ny < height:
+                    neighbor_id, _, neighbor_orientation = solved.get(nx, ny)
+                    side = (direction - orientation) % 4
+                    neighbor_side = (board.OPPOSITE[direction] - neighbor_orientation) % 4
+                    assert ((piece_id, side), (neighbor_id, neighbor_side)) in truth
+    return stats
+
+
+@pytest.mark.parametrize('search', ['greedy', 'astar', 'mean', 'beam'])
+@pytest.mark.parametrize('frontier', ['bucket', 'heap'])
+def test_solves_the_puzzle(connectivity, puzzle, monkeypatch, search, frontier):
+    _solve(connectivity, puzzle, monkeypatch, SEARCH=search, FRONTIER=frontier)
+
+
+def test_heap_and_bucket_frontiers_search_the_same_nodes(connectivity, puzzle, monkeypatch):
+    bucket = _solve(connectivity, puzzle, monkeypatch, FRONTIER='bucket')
+    heap = _solve(connectivity, puzzle, monkeypatch, FRONTIER='heap')
+    assert bucket == heap
+
+
+def test_one_way_penalty(connectivity, puzzle, monkeypatch):
+    listed = set((p, si, f[0], f[1]) for p, fits in connectivity.items() for si, side_fits in enumerate(fits) for f in side_fits)
+    assert any((q, sj, p, si) not in listed for (p, si, q, sj) in listed)
+    _solve(connectivity, puzzle, monkeypatch, ONE_WAY_PENALTY=connect.MUTUAL_PENALTY)
+
+
+def test_placed_bits_follow_the_dense_index(connectivity):
+    # far apart piece ids still only take one bit each
+    shifted = { 10 ** 6 + 1000 * piece_id: [[(10 ** 6 + 1000 * q, sj, e) for (q, sj, e) in side_fits] for side_fits in fits]
+                for piece_id, fits in connectivity.items() }
+    b = board.Board(3, 3, _index=board.build_index(shifted))
+    piece_id, orientation = next((p, o) for p, fits in shifted.items() for o in range(4) if b.fits_at(p, fits, 0, 0, o))
+    b.place(piece_id, shifted[piece_id], 0, 0, orientation)
+    assert b._placed == 1 << b._index[piece_id][0] and b._index[piece_id][0] < len(shifted)
+    assert b.can_place(piece_id, shifted[piece_id], 0, 0, orientation, debug=True)[1].endswith("has already been placed")
+    b.remove(0, 0)
+    assert b._placed == 0
+
+    # a piece that wasn't indexed gets the next slot
+    b._lookup(10 ** 9, shifted[piece_id])
+    assert b._index[10 ** 9][0] == len(shifted)
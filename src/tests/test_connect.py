@@ -0,0 +1,82 @@
+import os
+import json
+import shutil
+import pytest
+
+from core import connect, graph, pieces, sides
+
+
+def _build(puzzle, output_path, incremental=False):
+    directory, _, _, _ = puzzle
+    os.makedirs(output_path, exist_ok=True)
+    return connect.build(directory, str(output_path), incremental=incremental)
+
+
+def test_chunks_of_no_ids():
+    assert connect._chunks([], 8) == []
+    assert connect._chunks(set(), 8) == []
+
+
+def test_chunks_cover_every_id():
+    assert connect._chunks(range(10), 3) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_incremental_first_run_and_rerun(puzzle, tmp_path):
+    full = _build(puzzle, tmp_path / 'full')
+
+    # no stored fits yet: every piece is new and none is unchanged
+    first = _build(puzzle, tmp_path / 'incremental', incremental=True)
+    assert first == full
+
+    # nothing changed: every piece is unchanged and none is new
+    again = _build(puzzle, tmp_path / 'incremental', incremental=True)
+    assert again == full
+    with open(tmp_path / 'incremental' / graph.JSON_FILENAME, 'r') as f:
+        assert { int(p): fits for p, fits in json.load(f).items() } == full
+
+
+def test_mutual_rank_keeps_the_scored_errors():
+    fits = {
+        1: [[(2, 0, 100), (3, 0, 60)], [], [], []],
+        2: [[(1, 0, 100)], [], [], []],
+        3: [[(4, 0, 10)], [], [], []],
+        4: [[(3, 0, 10)], [], [], []],
+    }
+    ranked = connect.mutual_fits(fits, 'rank', penalty=2.0)
+    # 3 doesn't list 1 back, so it goes behind 2, with its own error
+    assert ranked[1][0] == [(2, 0, 100), (3, 0, 60)]
+    assert ranked[2][0] == [(1, 0, 100)]
+
+    reciprocal = connect.mutual_fits(fits, 'reciprocal')
+    assert reciprocal[1][0] == [(2, 0, 100)]
+    assert reciprocal[3][0] == [(4, 0, 10)]
+
+
+@pytest.mark.parametrize('use_index', [False, True])
+def test_incremental_after_adding_pieces(puzzle, tmp_path, monkeypatch, use_index):
+    directory, _, _, _ = puzzle
+    monkeypatch.setattr(connect, 'USE_INDEX', use_index)
+    full = _build(puzzle, tmp_path / 'full')
+
+    # the first 30 pieces, then all of them
+    subset = tmp_path / '2vec'
+    os.makedirs(subset)
+    piece_ids = sorted(set(int(f.split('_')[1]) for f in os.listdir(directory) if f.startswith('side_')))
+    for f in os.listdir(directory):
+        if f.startswith('side_') and int(f.split('_')[1]) in piece_ids[:30]:
+            shutil.copy(os.path.join(directory, f), subset)
+    os.makedirs(tmp_path / 'incremental')
+    assert len(connect.build(str(subset), str(tmp_path / 'incremental'), incremental=True)) == 30
+
+    for f in os.listdir(directory):
+        shutil.copy(os.path.join(directory, f), subset)
+    assert connect.build(str(subset), str(tmp_path / 'incremental'), incremental=True) == full
+
+
+@pytest.mark.parametrize('candidates', [2, 32])
+def test_index_prunes_to_the_exact_fits(puzzle, tmp_path, monkeypatch, candidates):
+    exact = _build(puzzle, tmp_path / 'exact')
+    # however few candidates it starts from, the index keeps looking until the pruned fits can't change
+    monkeypatch.setattr(connect, 'USE_INDEX', True)
+    monkeypatch.setattr(sides, 'INDEX_CANDIDATES', candidates)
+    assert _build(puzzle, tmp_path / 'index') == exact
@@ -0,0 +1,46 @@
+import os
+import pytest
+
+from core import connect, shards
+
+
+def test_sharded_build_matches_a_single_pass(puzzle, tmp_path, monkeypatch):
+    directory, _, _, _ = puzzle
+    monkeypatch.setattr(shards, 'SHARD_SIZE', 50)
+
+    os.makedirs(tmp_path / 'single')
+    single = connect.build(directory, str(tmp_path / 'single'))
+
+    shard_dir = str(tmp_path / 'shards')
+    ps = shards.load(directory)
+    total = len(shards.shards(ps))
+    # 164 non-edge sides, 4 tiles
+    assert total == 16
+
+    # two machines, each with half of the shards
+    shards.build(directory, shard_dir, selection=f"0-{total // 2 - 1}", processes=2)
+    with pytest.raises(Exception):
+        shards.merge(directory, shard_dir, str(tmp_path))
+    shards.build(directory, shard_dir, selection=f"{total // 2}-{total - 1}", processes=2)
+
+    os.makedirs(tmp_path / 'merged')
+    assert shards.merge(directory, shard_dir, str(tmp_path / 'merged')) == single
+
+
+def test_shards_are_not_computed_again(puzzle, tmp_path, monkeypatch):
+    directory, _, _, _ = puzzle
+    monkeypatch.setattr(shards, 'SHARD_SIZE', 50)
+    shard_dir = str(tmp_path / 'shards')
+    shards.build(directory, shard_dir, selection='0', processes=1)
+    first = os.path.getmtime(os.path.join(shard_dir, 'shard_0_0.json'))
+    shards.build(directory, shard_dir, selection='0-1', processes=1)
+    assert os.path.getmtime(os.path.join(shard_dir, 'shard_0_0.json')) == first
+    assert os.path.exists(os.path.join(shard_dir, 'shard_0_1.json'))
+
+
+def test_parse_selection():
+    assert shards.parse_selection('all', 4) == [0, 1, 2, 3]
+    assert shards.parse_selection('2', 4) == [2]
+    assert shards.parse_selection('1-9', 4) == [1, 2, 3]
+    with pytest.raises(Exception):
+        shards.parse_selection('a-b', 4)
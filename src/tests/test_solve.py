@@ -0,0 +1,57 @@
+import os
+import json
+import multiprocessing
+
+import solve
+from conftest import write_photo
+from core.rasters import PACK_FILENAME
+
+
+def _session(root, pack):
+    session = root / ('pack' if pack else 'bmp')
+    for d in (solve.RawDir, solve.SegDir, solve.VecDir, solve.RefDir):
+        os.makedirs(session / d)
+    # seed 1 cuts pieces that all vectorize
+    write_photo(session / solve.RawDir / '16.jpg', 3, 2, seed=1)
+    return session
+
+
+def _sides(vecDir):
+    out = {}
+    for f in sorted(os.listdir(vecDir)):
+        if f.startswith('side_'):
+            with open(vecDir / f, 'r') as fp:
+                out[f] = json.load(fp)
+    return out
+
+
+def test_packed_segmentation_writes_no_bitmaps(tmp_path):
+    bmp = _session(tmp_path, pack=False)
+    solve.extract_pieces(bmp)
+    bitmaps = sorted(f for f in os.listdir(bmp / solve.SegDir) if f.endswith('.bmp'))
+    assert len(bitmaps) == 6
+    with multiprocessing.Pool() as pool:
+        pool.map(solve._vectorize, [[bmp / solve.VecDir, bmp / solve.SegDir, f] for f in bitmaps])
+
+    packed = _session(tmp_path, pack=True)
+    solve.extract_pieces(packed, pack=True)
+    assert os.listdir(packed / solve.SegDir) == [PACK_FILENAME]
+
+    # step 2 reads the pack, and gets the same sides as from the bitmaps
+    solve._vectorize_all(packed / solve.VecDir, packed / solve.SegDir)
+    assert len(_sides(packed / solve.VecDir)) == 4 * 6
+    assert _sides(packed / solve.VecDir) == _sides(bmp / solve.VecDir)
+
+
+def test_seg_new_packs(tmp_path, monkeypatch):
+    raw = tmp_path / 'raw' / '16'
+    os.makedirs(raw)
+    write_photo(raw / '01.jpg', 2, 2, seed=1)
+    seg = tmp_path / solve.SegDir
+    os.makedirs(seg)
+    monkeypatch.setattr(solve, 'pathSeg', seg)
+    monkeypatch.setitem(solve.SEG_NEW_PARAMS, 'crop', None)
+
+    solve.seg_new(str(tmp_path / 'raw'), pack=True)
+    assert os.listdir(seg) == [PACK_FILENAME]
+    assert len(solve.RasterPack(seg / PACK_FILENAME)) == 4
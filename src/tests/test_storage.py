@@ -0,0 +1,114 @@
+"""
+Round trips of the binary formats: the connectivity graph, the side error matrix and the raster pack
+"""
+import os
+import json
+import numpy as np
+import pytest
+
+from core import graph
+from core.graph import Graph
+from core.matrix import ErrorMatrix, NO_MATCH
+from core.rasters import RasterPack
+
+
+CONNECTIVITY = {
+    7: [[], [(9, 2, 120), (8, 0, 480)], [(8, 3, 95)], []],
+    8: [[(7, 1, 480)], [], [], [(7, 2, 95)]],
+    9: [[], [], [(7, 1, 120)], [(8, 1, 3000)]],
+}
+
+
+def test_graph_round_trip(tmp_path):
+    path = tmp_path / graph.GRAPH_FILENAME
+    Graph.write(path, CONNECTIVITY)
+    g = Graph(path)
+    assert sorted(g) == [7, 8, 9]
+    assert len(g) == 3 and 8 in g and 10 not in g
+    assert g.to_dict() == CONNECTIVITY
+    assert [tuple(f) for f in g[7][1]] == [(9, 2, 120), (8, 0, 480)]
+    assert len(g[7][0]) == 0
+
+
+def test_graph_from_json(tmp_path):
+    json_path = tmp_path / graph.JSON_FILENAME
+    with open(json_path, 'w') as f:
+        json.dump(CONNECTIVITY, f)
+    g = Graph.from_json(json_path, tmp_path / graph.GRAPH_FILENAME)
+    assert g.to_dict() == CONNECTIVITY
+
+
+def test_graph_load_prefers_binary_and_falls_back_to_json(tmp_path):
+    graph.save(CONNECTIVITY, tmp_path)
+    assert isinstance(graph.load(tmp_path), Graph)
+
+    os.remove(tmp_path / graph.GRAPH_FILENAME)
+    assert graph.load(tmp_path) == CONNECTIVITY
+
+
+def test_graph_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(Exception):
+        Graph(path)
+
+
+def test_matrix_round_trip(tmp_path):
+    path = tmp_path / 'side_errors.bin'
+    piece_ids, side_ids = list(range(100, 110)), [0, 1, 2, 3, 0, 1, 2, 3, 0, 1]
+    errors = np.random.default_rng(0).uniform(0, 10, (10, 10)).astype(np.float32)
+
+    matrix = ErrorMatrix.create(path, piece_ids, side_ids, 'abc', tile=4)
+    assert matrix.n_tiles == 3 and len(matrix.missing()) == 9 and not matrix.complete()
+    for (ti, tj) in matrix.missing():
+        matrix.write_tile(ti, tj, errors[np.ix_(matrix.span(ti), matrix.span(tj))])
+    del matrix
+
+    matrix = ErrorMatrix(path)
+    assert matrix.complete()
+    # float16 on disk
+    np.testing.assert_allclose(np.concatenate([matrix.block(ti) for ti in range(matrix.n_tiles)]), errors, rtol=1e-3)
+    np.testing.assert_allclose(matrix.row(103, 3), errors[3], rtol=1e-3)
+
+    matches = matrix.matches(103, 3, max_error=5)
+    expected = np.flatnonzero(errors[3].astype(np.float16) <= 5)
+    assert sorted((p, s) for (p, s, _) in matches) == sorted((piece_ids[c], side_ids[c]) for c in expected)
+    assert [e for (_, _, e) in matches] == sorted(e for (_, _, e) in matches)
+    assert len(matrix.matches(103, 3, max_error=5, k=2)) == min(2, len(expected))
+    assert matrix.matches(999, 0, max_error=5) == []
+    assert matrix.fits(max_error=5)[103][3] == matches
+
+
+def test_matrix_clamps_to_no_match(tmp_path):
+    matrix = ErrorMatrix.create(tmp_path / 'm.bin', [1, 2], [0, 0], 'abc', tile=4)
+    matrix.write_tile(0, 0, np.full((2, 2), 1e6))
+    assert (matrix.block(0) == NO_MATCH).all()
+
+
+def test_matrix_resumes_only_the_same_sides(tmp_path):
+    path = tmp_path / 'side_errors.bin'
+    matrix = ErrorMatrix.create(path, [1, 2, 3], [0, 0, 0], 'abc', tile=2)
+    matrix.write_tile(0, 0, np.zeros((2, 2)))
+    del matrix
+
+    assert len(ErrorMatrix.open_or_create(path, [1, 2, 3], [0, 0, 0], 'abc', tile=2).missing()) == 3
+    assert len(ErrorMatrix.open_or_create(path, [1, 2, 3], [0, 0, 0], 'def', tile=2).missing()) == 4
+
+
+def test_raster_pack_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    pixels = [rng.integers(0, 2, (h, w)) for (h, w) in ((5, 9), (17, 8), (1, 1))]
+    path = tmp_path / 'pieces.pack'
+    RasterPack.write(path, [(id, f"{id}.bmp", p, (0, 0, p.shape[1], p.shape[0]), (0, 0)) for id, p in zip((4, 2, 30), pixels)])
+
+    pack = RasterPack(path)
+    assert len(pack) == 3 and sorted(pack.ids()) == [2, 4, 30] and 2 in pack and 5 not in pack
+    for id, p in zip((4, 2, 30), pixels):
+        loaded, width, height = pack.load(id)
+        assert (width, height) == (p.shape[1], p.shape[0])
+        np.testing.assert_array_equal(loaded, p)
+        assert pack.name(id) == f"{id}.bmp"
+    assert pack.digest(4) != pack.digest(2)
+    assert pack.digest(4) == RasterPack(path).digest(4)
+    with pytest.raises(KeyError):
+        pack.load(5)
@@ -7,6 +7,7 @@ import mimetypes
 
 from functools import reduce
 from core import builder
+from core.matrix import ErrorMatrix, MATRIX_FILENAME
 
 PORT = 8080
 ROOTPATH = 'src/http'
@@ -17,6 +18,10 @@ ERRORMAX = 1000000000
 conn = builder.load_conn()
 excl = set()
 
+# the side error matrix, if step 3 wrote one: matches at any threshold without rebuilding conn
+matrixFile = DATAPATH + '/3con/' + MATRIX_FILENAME
+matrix = ErrorMatrix(matrixFile) if os.path.exists(matrixFile) else None
+
 def load_aotu():
     with open('src/test/0tmp/shape.json', 'r') as f:
         return json.load(f)
@@ -89,7 +94,7 @@ def reevaluate_pieces(psides, pieces):
             fits = conn[int(pid)][int(sid)]
             for other in fits:
                 if other[0] == int(fit_pid) and other[1] == int(fit_sid):
-                    err_sum += other[2]
+                    err_sum += int(other[2])
                     break;
         
         if err_sum > 0:
@@ -139,10 +144,18 @@ def _matches(args):
     for p in piece[int(side)]:
         if (p[0] in excl or p[0] in dup):
             continue
-        res.append(p)
+        # fits from the binary graph are numpy records
+        res.append([int(v) for v in p])
         dup.append(p[0])
     return res
 
+# /api/rematch/<id>/<side>/<max error>, errors * 1000 like conn
+def _rematch(args):
+    id, side, maxerr = args
+    if matrix is None:
+        return []
+    return [[p, s, round(e * 1000)] for (p, s, e) in matrix.matches(int(id), int(side), float(maxerr)) if not p in excl]
+
 def _routeApi(req):
     
     try: